@@ -1,69 +1,352 @@
 import os
-from typing import List
+from typing import List, Optional
 from dotenv import load_dotenv, find_dotenv
 from llama_index.core import SimpleDirectoryReader
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core import Settings
 from llama_index.llms.gemini import Gemini
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import SummaryIndex, VectorStoreIndex, SimpleKeywordTableIndex
+from llama_index.core import SummaryIndex, VectorStoreIndex
+from llama_index.core import StorageContext, load_indices_from_storage
+from llama_index.core.data_structs.data_structs import IndexDict
+from llama_index.core.storage.docstore import SimpleDocumentStore
 from llama_index.core.tools import QueryEngineTool
 from llama_index.core.query_engine.router_query_engine import RouterQueryEngine
 from llama_index.core.selectors import LLMSingleSelector
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from fastapi import FastAPI, HTTPException, File, UploadFile, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from llama_index.core import get_response_synthesizer
+from llama_index.core import QueryBundle
+from llama_index.core.schema import MetadataMode, NodeRelationship
 from custom_query_engines import SummaryQueryEngine, VectorQueryEngine
 from custom_retriever import CustomRetriever
+from bm25_index import BM25Index, BM25Retriever
+from matrix_vector_store import MatrixVectorStore
+from semantic_router import SemanticSelector
+from answer_cache import AnswerCache
+from index_store import IndexStore, build_manifest, manifest_version, hash_file
+from embedding_cache import CachedEmbedding, open_cache
+from onnx_embedding import ONNXEmbedding
+from model_registry import ModelRegistry, registry
+from transformers import AutoTokenizer
+from optimum.onnxruntime import ORTModelForSequenceClassification
+from concurrency import ConcurrencyLimiter, LimitedStreamingResponse, run_blocking, run_build
+from sessions import SessionManager
+from document_parser import DocumentParser
+from ingest_jobs import JobManager, NullProgress
+from telemetry import annotate, span, start_trace
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import asyncio
+import copy
+import json
 import shutil
+import uuid
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# "onnx" uses the int8 export in ONNX_EMBED_DIR (see onnx_embedding.py) when it exists, "torch" forces HuggingFace
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "onnx")
+ONNX_EMBED_DIR = os.getenv("ONNX_EMBED_DIR", "onnx-embed/")
+RERANKER_DIR = os.getenv("RERANKER_DIR", "onnx/")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "200000"))
+# Passages are sized to fit the 512-token reranker window together with the query
+PASSAGE_SIZE = int(os.getenv("PASSAGE_SIZE", "320"))
+PASSAGE_OVERLAP = int(os.getenv("PASSAGE_OVERLAP", "32"))
+# Wordpieces embedded per text: a whole passage, with headroom for special tokens and for
+# the model's tokenizer splitting finer than the passage splitter counts, up to its 512 positions
+EMBED_MAX_LENGTH = min(PASSAGE_SIZE * 3 // 2, 512)
+FIRST_STAGE_TOP_K = int(os.getenv("FIRST_STAGE_TOP_K", "20"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "32"))
+# Above this many passages the vector store switches from exact to IVF search
+VECTOR_IVF_THRESHOLD = int(os.getenv("VECTOR_IVF_THRESHOLD", "50000"))
+FIRST_STAGE_TIMEOUT = float(os.getenv("FIRST_STAGE_TIMEOUT", "5"))
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.05"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "30000"))
+VECTOR_TOKEN_BUDGET = int(os.getenv("VECTOR_TOKEN_BUDGET", "8000"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+INGEST_EMBED_BATCH_SIZE = 256
+PARSED_CACHE_DIR = os.getenv("PARSED_CACHE_DIR", "parsed_cache")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or None
+ROUTER_KEYWORD_RULES = {
+    "case_outcome_tool": ["predict", "prediction", "outcome", "chances of winning"],
+    "summary_tool": ["summarize", "summarise", "summary"],
+}
+
+# Shared by every pipeline; uploaded files are parsed on its process pool
+document_parser = DocumentParser(cache_dir=PARSED_CACHE_DIR, max_workers=PARSE_WORKERS)
+
+def load_embed_backend():
+    if EMBED_BACKEND == "onnx" and os.path.isdir(ONNX_EMBED_DIR):
+        return ONNXEmbedding(model_path=ONNX_EMBED_DIR, max_length=EMBED_MAX_LENGTH)
+    return HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, max_length=EMBED_MAX_LENGTH)
+
+def embed_model_id():
+    """Name of the loaded embedding backend and how much of each text it embeds."""
+    return f"{registry.get('embed_backend').model_name}:{EMBED_MAX_LENGTH}"
+
+def load_embed_model():
+    # Embeddings are served from an on-disk cache keyed by model and chunk text;
+    # each backend (and truncation length) gets its own cache since their vectors differ
+    embed_model = registry.get("embed_backend")
+    cache_name = embed_model_id().replace("/", "__").replace(":", "__")
+    return CachedEmbedding(
+        embed_model,
+        open_cache(os.path.join(EMBEDDING_CACHE_DIR, cache_name), max_entries=EMBEDDING_CACHE_SIZE),
+    )
+
+def warm_up_reranker(model):
+    inputs = registry.get("reranker_tokenizer")("warm-up query", "warm-up passage", return_tensors="np")
+    model(**inputs)
+
+# The raw backend is warmed up directly, since a warm-up through the cache may never reach it
+registry.register("embed_backend", load_embed_backend, warm_up=lambda m: m.get_query_embedding("warm-up query"))
+registry.register("embed_model", load_embed_model)
+registry.register("reranker_tokenizer", lambda: AutoTokenizer.from_pretrained(RERANKER_DIR))
+registry.register(
+    "reranker_model",
+    lambda: ORTModelForSequenceClassification.from_pretrained(RERANKER_DIR, file_name="model_quantized.onnx"),
+    warm_up=warm_up_reranker,
+)
 
 class RAGPipeline:
-    def __init__(self, gemini_key_env_var='GEMINI_API_KEY'):
+    def __init__(self, gemini_key_env_var='GEMINI_API_KEY', models: ModelRegistry = registry, base_pipeline=None, parser=None, llm=None):
         # Load environment variables
         load_dotenv(find_dotenv())
         self.GEMINI_API_KEY = os.getenv(gemini_key_env_var)
 
-        # Set default models and embeddings
-        Settings.llm = Gemini(api_key=self.GEMINI_API_KEY)
-        Settings.embed_model = HuggingFaceEmbedding(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        # Set default models and embeddings; models are loaded once per process and shared
+        self.models = models
+        # A session pipeline indexes only its own uploads and queries the shared corpus through this one
+        self.base_pipeline = base_pipeline
+        self.parser = parser or document_parser
+        # Any LLM can stand in for Gemini, e.g. a deterministic stub for offline benchmarks
+        self.llm = llm or Gemini(api_key=self.GEMINI_API_KEY)
+        Settings.llm = self.llm
+        Settings.embed_model = self.models.get("embed_model")
 
         self.documents = None
         self.single_document = None
         self.nodes = None
+        self.parent_nodes = None
         self.nodes_single = None
+        self.summary_files = []
         self.summary_index = None
         self.vector_index = None
         self.keyword_index = None
+        self.storage_context = None
+        self.index_version = None
+        self.file_hashes = {}
+        self.file_doc_ids = {}
+        self.file_nodes = {}
         self.summary_query_engine = None
         self.vector_query_engine = None
         self.summary_tool = None
         self.vector_tool = None
         self.case_outcome_tool = None
+        self.corpus_tool = None
+        self.query_engine_tools = []
+        self.selector = None
         self.query_engine = None
+        self.answer_cache = AnswerCache(
+            max_entries=ANSWER_CACHE_SIZE,
+            ttl=ANSWER_CACHE_TTL,
+            similarity_threshold=ANSWER_CACHE_THRESHOLD,
+        )
 
     def load_documents(self, input_dir=None, input_files=None):
         """Load documents from a directory or specific files."""
+        # Use file names as document ids so documents can later be replaced by path
         if input_dir:
-            self.documents = SimpleDirectoryReader(input_dir=input_dir).load_data()
+            self.documents = SimpleDirectoryReader(input_dir=input_dir, filename_as_id=True).load_data()
         if input_files:
-            self.single_document = SimpleDirectoryReader(input_files=input_files).load_data()
+            self.single_document = SimpleDirectoryReader(input_files=input_files, filename_as_id=True).load_data()
 
-    def split_documents(self, chunk_size=8192):
+    def split_documents(self, chunk_size=8192, passage_size=PASSAGE_SIZE):
         """Split documents into chunks for processing."""
         splitter = SentenceSplitter(chunk_size=chunk_size)
         if self.documents:
-            self.nodes = splitter.get_nodes_from_documents(self.documents)
+            self.parent_nodes, self.nodes = self._split_small_to_big(self.documents, chunk_size, passage_size)
         if self.single_document:
             self.nodes_single = splitter.get_nodes_from_documents(self.single_document)
 
+    @staticmethod
+    def _split_small_to_big(documents, chunk_size, passage_size):
+        """Split documents into large parent chunks and reranker-sized passages linked to them.
+
+        Passages are what gets embedded, keyword-indexed and reranked, while
+        their parent chunk is what ends up in the LLM context.
+        """
+        parent_splitter = SentenceSplitter(chunk_size=chunk_size)
+        passage_splitter = SentenceSplitter(chunk_size=passage_size, chunk_overlap=PASSAGE_OVERLAP)
+        parents = parent_splitter.get_nodes_from_documents(documents)
+        passages = []
+        for parent in parents:
+            for passage in passage_splitter.get_nodes_from_documents([parent]):
+                # Passages keep the parent's document as source, so they can be deleted by document id
+                passage.relationships[NodeRelationship.SOURCE] = parent.relationships[NodeRelationship.SOURCE]
+                passage.relationships[NodeRelationship.PARENT] = parent.as_related_node_info()
+                passages.append(passage)
+        return parents, passages
+
+    @staticmethod
+    def _new_storage_context():
+        """Create an empty storage context backed by the matrix vector store."""
+        return StorageContext.from_defaults(vector_store=MatrixVectorStore(ivf_threshold=VECTOR_IVF_THRESHOLD))
+
     def create_indices(self):
         """Create the summary index and vector store index."""
+        # All indices share one storage context so they can be persisted together
+        self.storage_context = self._new_storage_context()
         if self.nodes_single:
-            self.summary_index = SummaryIndex(self.nodes_single)
+            self.summary_index = SummaryIndex(self.nodes_single, storage_context=self.storage_context)
+            self.summary_index.set_index_id("summary")
         if self.nodes:
-            self.vector_index = VectorStoreIndex(self.nodes)
-            self.keyword_index = SimpleKeywordTableIndex(self.nodes)
+            self.vector_index = VectorStoreIndex(self.nodes, storage_context=self.storage_context)
+            self.vector_index.set_index_id("vector")
+            # Parent chunks are not indexed, only stored so passages can be expanded to them
+            self.storage_context.docstore.add_documents(self.parent_nodes)
+            self.keyword_index = BM25Index()
+            self.keyword_index.add_nodes(self.nodes)
+
+    def load_indices(self, storage_context):
+        """Attach the indices persisted in a storage context."""
+        self.storage_context = storage_context
+        indices = {index.index_id: index for index in load_indices_from_storage(storage_context)}
+        self.summary_index = indices.get("summary")
+        self.vector_index = indices.get("vector")
+
+    def load_or_build(self, input_dir, index_store):
+        """Load the persisted indices for a corpus, rebuilding them only when its files changed."""
+        manifest = build_manifest(input_dir=input_dir)
+        # Vectors from another embedding backend are not interchangeable, so it is part of the version
+        version = manifest_version(dict(manifest, __embed_model__=embed_model_id()))
+        if index_store.exists(version):
+            print(f"Loading indices for '{input_dir}' (version {version})...")
+            self.load_indices(index_store.load(version))
+            self.keyword_index = index_store.load_bm25(version)
+        else:
+            print(f"Corpus '{input_dir}' changed, building indices (version {version})...")
+            self.load_documents(input_dir=input_dir)
+            self.split_documents()
+            self.create_indices()
+            index_store.save(self.storage_context, manifest, version, bm25_index=self.keyword_index)
+        self.file_hashes = manifest
+        self.index_version = version
+
+    def copy_indices_from(self, other):
+        """Start from a copy of another pipeline's indices, so only files changed since then need indexing.
+
+        Nodes and vectors are shared, while the docstore, vector store and BM25
+        index are copied, so indexing into this pipeline never changes the other.
+        """
+        if other.storage_context is None or other.vector_index is None:
+            return
+        # Serialized nodes are replaced rather than modified; the other collections hold nested lists
+        docstore = SimpleDocumentStore.from_dict({
+            name: dict(values) if name.endswith("/data") else copy.deepcopy(values)
+            for name, values in other.storage_context.docstore.to_dict().items()
+        })
+        self.storage_context = StorageContext.from_defaults(
+            docstore=docstore, vector_store=other.storage_context.vector_store.copy()
+        )
+        self.vector_index = VectorStoreIndex(
+            index_struct=IndexDict.from_dict(other.vector_index.index_struct.to_dict()),
+            storage_context=self.storage_context,
+        )
+        self.keyword_index = other.keyword_index.copy()
+        self.file_hashes = dict(other.file_hashes)
+        self.file_doc_ids = dict(other.file_doc_ids)
+        self.file_nodes = dict(other.file_nodes)
+
+    def update_documents(self, input_files, chunk_size=8192, passage_size=PASSAGE_SIZE, summary_files=None, progress=None):
+        """Incrementally index new or changed files.
+
+        Unchanged files are skipped, changed files have their old documents
+        deleted before the new nodes are inserted. The summary index is rebuilt
+        over summary_files (default: the given files) from the cached nodes.
+        Progress of the parse, chunk, embed and index stages is reported to
+        `progress`. Returns True if anything changed.
+        """
+        progress = progress or NullProgress()
+        summary_files = input_files if summary_files is None else summary_files
+        if self.storage_context is None:
+            self.storage_context = self._new_storage_context()
+        if self.vector_index is None:
+            self.vector_index = VectorStoreIndex([], storage_context=self.storage_context)
+            self.vector_index.set_index_id("vector")
+        if self.keyword_index is None:
+            self.keyword_index = BM25Index()
+
+        changed = False
+        hashes = {os.path.normpath(path): hash_file(path) for path in input_files}
+        new_hashes = {path: h for path, h in hashes.items() if self.file_hashes.get(path) != h}
+        # Parse every changed file at once, spread over the parser's process pool
+        progress.start("parse", len(new_hashes))
+        parsed = self.parser.parse(list(new_hashes), hashes=new_hashes, on_parsed=lambda path: progress.advance("parse"))
+
+        progress.start("chunk", len(new_hashes))
+        split = {}
+        for path in new_hashes:
+            split[path] = self._split_small_to_big(parsed[path], chunk_size, passage_size)
+            progress.advance("chunk")
+
+        # Embed ahead of insertion so progress can be reported; insert_nodes keeps existing embeddings
+        all_passages = [passage for _, passages in split.values() for passage in passages]
+        progress.start("embed", len(all_passages))
+        for start in range(0, len(all_passages), INGEST_EMBED_BATCH_SIZE):
+            batch = all_passages[start:start + INGEST_EMBED_BATCH_SIZE]
+            embeddings = Settings.embed_model.get_text_embedding_batch(
+                [passage.get_content(metadata_mode=MetadataMode.EMBED) for passage in batch]
+            )
+            for passage, embedding in zip(batch, embeddings):
+                passage.embedding = embedding
+            progress.advance("embed", len(batch))
+
+        progress.start("index", len(new_hashes))
+        for path, file_hash in new_hashes.items():
+            self.delete_documents([path])
+            documents = parsed[path]
+            parents, passages = split[path]
+            self.storage_context.docstore.add_documents(parents)
+            self.vector_index.insert_nodes(passages)
+            self.keyword_index.add_nodes(passages)
+
+            self.file_hashes[path] = file_hash
+            self.file_doc_ids[path] = [doc.doc_id for doc in documents]
+            self.file_nodes[path] = parents
+            changed = True
+            progress.advance("index")
+
+        # The summary index only covers the files of the latest upload
+        nodes_single = [node for path in summary_files for node in self.file_nodes.get(os.path.normpath(path), [])]
+        self.summary_files = [os.path.normpath(path) for path in summary_files]
+        if changed or nodes_single != self.nodes_single or self.summary_index is None:
+            self.nodes_single = nodes_single
+            self.summary_index = SummaryIndex(self.nodes_single, storage_context=self.storage_context)
+            self.summary_index.set_index_id("summary")
+            changed = True
+
+        # The summary index covers only this upload, so its files are part of the version
+        summary_key = ",".join(sorted(os.path.normpath(path) for path in summary_files))
+        self.index_version = manifest_version(dict(self.file_hashes, __summary__=summary_key))
+        return changed
+
+    def delete_documents(self, input_files):
+        """Remove every document loaded from the given files from the indices."""
+        for path in input_files:
+            path = os.path.normpath(path)
+            # Parent chunks are only referenced by their passages, so they are removed explicitly
+            for parent in self.file_nodes.pop(path, []):
+                self.storage_context.docstore.delete_document(parent.node_id, raise_error=False)
+            for doc_id in self.file_doc_ids.pop(path, []):
+                # The vector index also clears the passages from the shared docstore
+                self.keyword_index.delete_ref_doc(doc_id)
+                self.vector_index.delete_ref_doc(doc_id, delete_from_docstore=True)
+            self.file_hashes.pop(path, None)
 
     def create_query_engines(self):
         """Create query engines for summary and vector-based retrieval."""
@@ -71,21 +354,30 @@ class RAGPipeline:
             self.summary_query_engine = SummaryQueryEngine(
                 retriever=self.summary_index.as_retriever(similarity_top_k=10),
                 synthesizer=get_response_synthesizer(),
-                llm = Settings.llm
+                llm = self.llm,
+                token_budget=SUMMARY_TOKEN_BUDGET
             )
-        if self.vector_index and self.keyword_index:
+        if self.vector_index and self.keyword_index is not None:
 
             custom_retriever = CustomRetriever(
-            vector_retriever=self.vector_index.as_retriever(),
-            keyword_retriever=self.keyword_index.as_retriever(),
-            bert_model="onnx/",
-            mode="AND"
+            vector_retriever=self.vector_index.as_retriever(similarity_top_k=FIRST_STAGE_TOP_K),
+            keyword_retriever=BM25Retriever(
+                self.keyword_index, self.storage_context.docstore, similarity_top_k=FIRST_STAGE_TOP_K
+            ),
+            tokenizer=self.models.get("reranker_tokenizer"),
+            model=self.models.get("reranker_model"),
+            mode="RRF",
+            max_candidates=RERANK_CANDIDATES,
+            vector_timeout=FIRST_STAGE_TIMEOUT,
+            keyword_timeout=FIRST_STAGE_TIMEOUT,
+            docstore=self.storage_context.docstore
         )
 
             self.vector_query_engine = VectorQueryEngine(
                 retriever=custom_retriever,
                 synthesizer=get_response_synthesizer(),
-                llm = Settings.llm
+                llm = self.llm,
+                token_budget=VECTOR_TOKEN_BUDGET
             )
 
     def create_tools(self):
@@ -93,24 +385,33 @@ class RAGPipeline:
         if self.summary_query_engine:
             self.summary_tool = QueryEngineTool.from_defaults(
                 query_engine=self.summary_query_engine,
+                name="summary_tool",
                 description="Useful for summarization questions related to legal Case Files."
             )
         if self.vector_query_engine:
             self.vector_tool = QueryEngineTool.from_defaults(
                 query_engine=self.vector_query_engine,
+                name="vector_tool",
                 description="Useful for retrieving specific context from the legal cases provided. Provides all the relevant Acts, Sections, and other legal information related to the query in the response."
             )
         if self.vector_query_engine:
             self.case_outcome_tool = QueryEngineTool.from_defaults(
                 query_engine=self.vector_query_engine,
+                name="case_outcome_tool",
                 description="Useful for predicting outcome of a given case or scenario in the query using the legal cases provided as context when explicityly asked for outcome or prediction."
                 
             )
+        if self.base_pipeline is not None and self.base_pipeline.vector_query_engine:
+            self.corpus_tool = QueryEngineTool.from_defaults(
+                query_engine=self.base_pipeline.vector_query_engine,
+                name="corpus_tool",
+                description="Useful for retrieving context from the reference corpus of past legal cases, rather than the uploaded Case Files."
+            )
 
     def create_router_engine(self, verbose=True):
         """Create the router engine to handle query routing."""
         # Check if all the tools are valid
-        query_engine_tools = [self.summary_tool, self.vector_tool, self.case_outcome_tool]
+        query_engine_tools = [self.summary_tool, self.vector_tool, self.case_outcome_tool, self.corpus_tool]
         
         # Remove any None tools
         query_engine_tools = [tool for tool in query_engine_tools if tool is not None]
@@ -119,25 +420,115 @@ class RAGPipeline:
         if not query_engine_tools:
             raise ValueError("No valid query engine tools found. Cannot create router engine.")
 
+        # Route locally by embedding similarity, asking the LLM only for close calls.
+        # Keep the selector and tools around so streaming queries can route themselves.
+        self.query_engine_tools = query_engine_tools
+        # Tools wrapping the same engine answer alike, so the LLM is never asked to pick between them
+        tool_groups = {}
+        for tool in query_engine_tools:
+            tool_groups.setdefault(id(tool.query_engine), []).append(tool.metadata.name)
+        self.selector = SemanticSelector(
+            keyword_rules=ROUTER_KEYWORD_RULES,
+            margin=ROUTER_MARGIN,
+            fallback_selector=LLMSingleSelector.from_defaults(llm=self.llm),
+            tool_groups=list(tool_groups.values()),
+        )
         self.query_engine = RouterQueryEngine(
-            selector=LLMSingleSelector.from_defaults(),
+            selector=self.selector,
             query_engine_tools=query_engine_tools,
             verbose=verbose
         )
 
+    def memory_usage(self):
+        """Rough number of bytes held by this pipeline's own indices."""
+        if self.storage_context is None:
+            return 0
+        text = sum(len(node.get_content()) for node in self.storage_context.docstore.docs.values())
+        vectors = getattr(self.storage_context.vector_store, "nbytes", 0)
+        keywords = self.keyword_index.nbytes if self.keyword_index is not None else 0
+        return text + vectors + keywords
+
     def query(self, query):
-        """Query the router engine."""
-        response = self.query_engine.query(query)
-        return str(response)
+        """Query the router engine, answering repeated questions from the cache."""
+        with span("query"):
+            with span("cache.get"):
+                cached = self.answer_cache.get(query, self.index_version)
+            annotate("cache_hit", cached is not None)
+            if cached is not None:
+                return cached
+            response = str(self.query_engine.query(query))
+            with span("cache.put"):
+                self.answer_cache.put(query, response, self.index_version)
+            return response
+
+    async def aquery(self, query):
+        """Query the router engine without blocking the event loop."""
+        with span("query"):
+            with span("cache.get"):
+                cached = await run_blocking(self.answer_cache.get, query, self.index_version)
+            annotate("cache_hit", cached is not None)
+            if cached is not None:
+                return cached
+            response = str(await self.query_engine.aquery(query))
+            with span("cache.put"):
+                await run_blocking(self.answer_cache.put, query, response, self.index_version)
+            return response
+
+    async def astream_query(self, query):
+        """Route a query and stream the answer.
+
+        Yields a single ("metadata", {...}) event with the chosen tool and the
+        source node ids, followed by one ("token", text) event per chunk.
+        """
+        # Spans the whole stream, including the time the client takes to read it
+        with span("query"):
+            with span("cache.get"):
+                cached = await run_blocking(self.answer_cache.get, query, self.index_version)
+            annotate("cache_hit", cached is not None)
+            if cached is not None:
+                yield "metadata", {"tool": None, "reason": "Answered from cache.", "source_nodes": []}
+                yield "token", cached
+                return
+
+            choices = [tool.metadata for tool in self.query_engine_tools]
+            result = await self.selector.aselect(choices, QueryBundle(query))
+            tool = self.query_engine_tools[result.ind]
+            annotate("tool", tool.metadata.name)
+
+            nodes, token_stream = await tool.query_engine.astream_query(query)
+            yield "metadata", {
+                "tool": tool.metadata.name,
+                "reason": result.reason,
+                "source_nodes": [n.node.node_id for n in nodes],
+            }
+            answer = []
+            # Includes the time the client takes to read each token
+            with span("llm.stream"):
+                async for chunk in token_stream:
+                    if chunk.delta:
+                        answer.append(chunk.delta)
+                        yield "token", chunk.delta
+            with span("cache.put"):
+                await run_blocking(self.answer_cache.put, query, "".join(answer), self.index_version)
 
 # Your FastAPI app and endpoint definitions...
 
 UPLOAD_DIR = "uploads"
-if os.path.exists(UPLOAD_DIR):
-    shutil.rmtree(UPLOAD_DIR)
-os.makedirs(UPLOAD_DIR)
-
-file_uploaded = False
+DEFAULT_CORPUS_DIR = "summaries"
+INDEX_STORE_DIR = os.getenv("INDEX_STORE_DIR", "storage")
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "8"))
+MAX_QUEUED_QUERIES = int(os.getenv("MAX_QUEUED_QUERIES", "32"))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "30"))
+MAX_CONCURRENT_INGESTS = int(os.getenv("MAX_CONCURRENT_INGESTS", "2"))
+MAX_UPLOAD_FILE_SIZE = int(float(os.getenv("MAX_UPLOAD_FILE_MB", "50")) * 1024 * 1024)
+MAX_UPLOAD_REQUEST_SIZE = int(float(os.getenv("MAX_UPLOAD_REQUEST_MB", "200")) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+SESSION_MEMORY_BUDGET = int(float(os.getenv("SESSION_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024)
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+SESSION_SWEEP_INTERVAL = 60
+SUPPORTED_UPLOAD_EXTENSIONS = ('.txt', '.pdf', '.docx')
+query_limiter = ConcurrencyLimiter(MAX_CONCURRENT_QUERIES, MAX_QUEUED_QUERIES, queue_timeout=QUEUE_TIMEOUT)
+ingest_jobs = JobManager(max_concurrent=MAX_CONCURRENT_INGESTS)
 
 app = FastAPI()
 app.add_middleware(
@@ -148,64 +539,302 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-rag_pipeline = RAGPipeline()
+# Loaded in the background after startup, once the shared models are warm
+rag_pipeline = None
+corpus_task = None
+corpus_error = None
+index_store = IndexStore(root=INDEX_STORE_DIR, name=DEFAULT_CORPUS_DIR)
+# Every session's uploads are indexed in its own pipeline, layered over the default corpus
+sessions = SessionManager(
+    pipeline_factory=lambda: RAGPipeline(base_pipeline=rag_pipeline),
+    upload_root=UPLOAD_DIR,
+    memory_budget=SESSION_MEMORY_BUDGET,
+    idle_ttl=SESSION_IDLE_TTL,
+)
+session_sweeper = None
+
+def load_default_pipeline():
+    """Load the default corpus from the index store, building it only if it changed."""
+    global rag_pipeline
+    pipeline = RAGPipeline()
+    pipeline.load_or_build(DEFAULT_CORPUS_DIR, index_store)
+    pipeline.create_query_engines()
+    pipeline.create_tools()
+    pipeline.create_router_engine()
+    # Published only once it can answer queries
+    rag_pipeline = pipeline
+
+async def load_corpus():
+    """Background task: load or build the default corpus without holding up startup."""
+    global corpus_error
+    try:
+        await run_build(load_default_pipeline)
+    except Exception as e:
+        corpus_error = str(e)
+        print(f"Loading the default corpus failed: {e}")
+
+def build_session_pipeline(current, file_paths, progress):
+    """Build the next snapshot of a session's pipeline beside the live one.
+
+    The snapshot starts from a copy of the live pipeline's indices and only
+    indexes the files of this upload that are new or changed. An upload that
+    changes nothing returns the live pipeline as it is. The live pipeline is
+    never touched.
+    """
+    file_paths = list(dict.fromkeys(os.path.normpath(path) for path in file_paths))
+    unchanged = all(current.file_hashes.get(path) == hash_file(path) for path in file_paths)
+    if unchanged and current.query_engine is not None and set(file_paths) == set(current.summary_files):
+        return current
+
+    pipeline = RAGPipeline(base_pipeline=rag_pipeline, parser=current.parser, llm=current.llm)
+    pipeline.copy_indices_from(current)
+    pipeline.update_documents(file_paths, progress=progress)
+
+    progress.start("engines", 1)
+    pipeline.create_query_engines()
+    pipeline.create_tools()
+    pipeline.create_router_engine()
+    progress.advance("engines")
+    return pipeline
+
+async def ingest_uploads(session, file_paths, job):
+    """Background job: index an upload, then swap the session over to the new snapshot."""
+    # One ingestion per session at a time, so snapshots build on each other
+    try:
+        async with session.lock:
+            pipeline = await run_build(build_session_pipeline, session.pipeline, file_paths, job)
+            # A single assignment: queries see either the old snapshot or the new one
+            session.pipeline = pipeline
+            sessions.update_memory(session, await run_build(pipeline.memory_usage))
+    finally:
+        session.pending_jobs -= 1
+    return {"files": len(file_paths), "index_version": pipeline.index_version}
+
+def save_upload(file, path, max_bytes=MAX_UPLOAD_FILE_SIZE):
+    """Copy an upload to disk in chunks, removing it again if it exceeds max_bytes."""
+    size = 0
+    with open(path, "wb") as buffer:
+        while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            buffer.write(chunk)
+    if size > max_bytes:
+        os.remove(path)
+        raise HTTPException(status_code=413, detail=f"{file.filename} is larger than {max_bytes // (1024 * 1024)} MB.")
+
+def pipeline_for(session_id):
+    """The session's pipeline if it has uploads, otherwise the default corpus."""
+    session = sessions.get(session_id)
+    # Until its first ingestion job finishes, a session has nothing of its own to query
+    if session is not None and session.pipeline.query_engine is not None:
+        return session.pipeline
+    if rag_pipeline is None:
+        raise HTTPException(
+            status_code=503,
+            detail="The default corpus is still loading, please retry shortly.",
+            headers={"Retry-After": "5"},
+        )
+    return rag_pipeline
+
+class UploadSizeLimit:
+    """Reject oversized uploads, whether or not they declare a Content-Length.
+
+    A declared size over the limit is refused before the body is read; otherwise
+    the body is counted as it arrives and the request is aborted once it passes
+    the limit, so a chunked upload cannot spool an unbounded body to disk.
+    """
+
+    def __init__(self, app, path: str, max_bytes: int):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def too_large(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"Upload is larger than {self.max_bytes // (1024 * 1024)} MB.")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            error = self.too_large()
+            await JSONResponse(status_code=error.status_code, content={"detail": error.detail})(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised from inside the body parser, so FastAPI answers with it.
+                    raise self.too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadSizeLimit, path="/upload-files", max_bytes=MAX_UPLOAD_REQUEST_SIZE)
+
+@app.on_event("startup")
+async def startup():
+    global corpus_task, session_sweeper
+    # Sessions do not survive a restart, so neither do their uploads
+    if os.path.exists(UPLOAD_DIR):
+        shutil.rmtree(UPLOAD_DIR)
+    os.makedirs(UPLOAD_DIR)
+    # Only the model warm-up delays accepting connections; a corpus build can take
+    # much longer, so /healthz answers and /readyz reports 503 while it runs
+    await run_blocking(registry.warm_up)
+    corpus_task = asyncio.create_task(load_corpus())
+    session_sweeper = asyncio.create_task(sweep_idle_sessions())
+
+async def sweep_idle_sessions():
+    """Background task: drop sessions that have been idle for SESSION_IDLE_TTL."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        evicted = sessions.evict_idle()
+        if evicted:
+            print(f"Evicted {evicted} idle sessions")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: models are warm and the default corpus can be queried."""
+    ready = registry.ready and rag_pipeline is not None
+    corpus = "ready" if rag_pipeline is not None else f"failed: {corpus_error}" if corpus_error else "loading"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "corpus": corpus, "models": registry.status()},
+    )
 
 class QueryRequest(BaseModel):
     question: str
 
 @app.post("/upload-files")
-async def upload_files(files: List[UploadFile] = File(...)):
-    """Handle multiple file uploads, save them, and update the pipeline."""
-    global file_uploaded
+async def upload_files(files: List[UploadFile] = File(...), x_session_id: Optional[str] = Header(None)):
+    """Handle multiple file uploads, save them, and index them in a background job.
+
+    Uploads without an X-Session-ID header start a new session; its id is
+    returned with the id of the job, whose progress is at /jobs/{job_id}.
+    """
+    # Reject bad requests before a session, its directory and pipeline exist
+    session_id = sessions.validate(x_session_id) if x_session_id else uuid.uuid4().hex
+    for file in files:
+        if not file.filename.endswith(SUPPORTED_UPLOAD_EXTENSIONS):
+            raise HTTPException(status_code=400, detail="Unsupported file type. Please upload .txt, .pdf, or .docx files.")
+
+    new_session = session_id not in sessions
+    session = sessions.get_or_create(session_id)
+    # Pin the session while its files are saved, so neither budget eviction nor the idle
+    # sweeper removes its upload directory mid-save; the job takes over the pin once submitted
+    session.pending_jobs += 1
+    submitted = False
     try:
         uploaded_file_paths = []
 
         # Save all uploaded files to the local directory
         for file in files:
-            if not file.filename.endswith(('.txt', '.pdf', '.docx')):
-                raise HTTPException(status_code=400, detail="Unsupported file type. Please upload .txt, .pdf, or .docx files.")
-            
-            upload_path = os.path.join(UPLOAD_DIR, file.filename)
-            with open(upload_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            upload_path = os.path.join(session.upload_dir, os.path.basename(file.filename))
+            # Stream to disk on the worker pool so large files do not stall the event loop
+            await run_blocking(save_upload, file, upload_path)
             uploaded_file_paths.append(upload_path)
         
-        # Reload the pipeline with the uploaded files
-        rag_pipeline.load_documents(input_dir=UPLOAD_DIR, input_files=uploaded_file_paths)
-        rag_pipeline.split_documents()
-        rag_pipeline.create_indices()
-        rag_pipeline.create_query_engines()
-        rag_pipeline.create_tools()
-        rag_pipeline.create_router_engine()
+        # Respond right away; queries keep using the current snapshot until the job swaps in the new one.
+        # The pending job keeps the session pinned while it waits for a slot, and unpins it when done.
+        job = ingest_jobs.submit(
+            lambda job: ingest_uploads(session, uploaded_file_paths, job),
+            session_id=session.session_id,
+        )
+        submitted = True
 
-        file_uploaded = True
-        return {"message": "Files uploaded successfully", "file_paths": uploaded_file_paths}
+        return JSONResponse(status_code=202, content={
+            "message": "Files uploaded successfully, indexing started",
+            "session_id": session.session_id,
+            "job_id": job.job_id,
+            "file_paths": uploaded_file_paths,
+        })
 
     except Exception as e:
+        if not submitted:
+            session.pending_jobs -= 1
+        # A session this request created is of no use without its upload
+        if new_session and not session.busy:
+            sessions.evict(session.session_id)
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=f"Error uploading files: {str(e)}")
 
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Progress of an ingestion job: status, per-stage counts and ETA."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
 @app.post("/query")
-async def query_rag(request: QueryRequest):
-    """Handle incoming queries and return the model's response."""
-    global file_uploaded
-    if not file_uploaded:
-        print("No files uploaded. Loading default documents...")
-        # Load default documents if no files are uploaded
-        rag_pipeline.load_documents(input_dir='summaries')
-        rag_pipeline.split_documents()
-        rag_pipeline.create_indices()
-        rag_pipeline.create_query_engines()
-        rag_pipeline.create_tools()
-        rag_pipeline.create_router_engine()
+async def query_rag(request: QueryRequest, x_session_id: Optional[str] = Header(None), x_trace: Optional[str] = Header(None)):
+    """Handle incoming queries and return the model's response.
+
+    With an X-Trace header, the response also holds the time spent in each stage.
+    """
+    pipeline = pipeline_for(x_session_id)
+    trace = start_trace() if x_trace else None
 
     query = request.question
-    try:
-        # Use the RAG pipeline to query the uploaded or default documents
-        response = rag_pipeline.query(query)
-        return {"response": response}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error during query: {str(e)}")
+    async with query_limiter:
+        try:
+            # Use the RAG pipeline to query the uploaded or default documents
+            response = await pipeline.aquery(query)
+            if trace is not None:
+                return {"response": response, "trace": trace.to_dict()}
+            return {"response": response}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error during query: {str(e)}")
     
+@app.post("/query/stream")
+async def query_rag_stream(request: QueryRequest, x_session_id: Optional[str] = Header(None), x_trace: Optional[str] = Header(None)):
+    """Stream the model's response as Server-Sent Events, retrieval metadata first.
+
+    With an X-Trace header, a "trace" event with the time spent in each stage precedes "done".
+    """
+    pipeline = pipeline_for(x_session_id)
+
+    # Take the slot before responding so back-pressure still answers with a 503
+    await query_limiter.acquire()
+
+    async def event_stream():
+        # Started here, since the response body is streamed from another task
+        trace = start_trace() if x_trace else None
+        try:
+            async for event, data in pipeline.astream_query(request.question):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            if trace is not None:
+                yield f"event: trace\ndata: {json.dumps(trace.to_dict())}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps(f'Error during query: {str(e)}')}\n\n"
+
+    # The response gives the slot back, also when the client leaves before the body starts
+    return LimitedStreamingResponse(event_stream(), query_limiter, media_type="text/event-stream")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics, including per-stage query latency histograms."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/sessions/stats")
+async def session_stats():
+    """Live sessions, their memory use, and lookup hit-rate and eviction counters."""
+    return sessions.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=80)
\ No newline at end of file
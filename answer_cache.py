@@ -0,0 +1,121 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+
+@dataclass
+class _Entry:
+    response: str
+    embedding: np.ndarray
+    created: float
+
+
+class AnswerCache:
+    """Bounded cache of final answers in front of RAGPipeline.query.
+
+    Queries are first matched exactly on their normalized text, then by cosine
+    similarity of their embeddings against every cached query. Entries expire
+    after `ttl` seconds, the least recently used entry is dropped beyond
+    `max_entries`, and the whole cache is cleared whenever the index version
+    it is asked about differs from the one its entries were computed against.
+    """
+
+    def __init__(
+        self,
+        embed_model: Optional[BaseEmbedding] = None,
+        max_entries: int = 512,
+        ttl: float = 3600.0,
+        similarity_threshold: float = 0.95,
+    ) -> None:
+        self._embed_model = embed_model
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Query embeddings stacked in `_matrix_keys` order, rebuilt after inserts and evictions
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._version: Optional[str] = None
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Lowercase, collapse whitespace and drop surrounding punctuation."""
+        return re.sub(r"\s+", " ", query.lower()).strip(" ?!.,;:")
+
+    def _embed(self, text: str) -> np.ndarray:
+        embed_model = self._embed_model or Settings.embed_model
+        embedding = np.asarray(embed_model.get_query_embedding(text), dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def _check_version(self, version: Optional[str]) -> None:
+        if version != self._version:
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if now - entry.created > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def get(self, query: str, version: Optional[str]) -> Optional[str]:
+        """Return a cached answer for the query or a near-identical one, if any."""
+        key = self.normalize(query)
+        with self._lock:
+            self._check_version(version)
+            self._evict_expired()
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.response
+            if not self._entries:
+                self.misses += 1
+                return None
+
+        embedding = self._embed(key)
+        with self._lock:
+            if self._version != version or not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.stack([self._entries[k].embedding for k in self._matrix_keys])
+            scores = self._matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            best_key = self._matrix_keys[best]
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key].response
+
+    def put(self, query: str, response: str, version: Optional[str]) -> None:
+        """Cache the answer to a query computed against the given index version."""
+        key = self.normalize(query)
+        embedding = self._embed(key)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = _Entry(response=response, embedding=embedding, created=time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
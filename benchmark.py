@@ -0,0 +1,392 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.llms import CompletionResponse, CompletionResponseGen, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+from agent import FIRST_STAGE_TOP_K, RERANKER_DIR, RAGPipeline
+from bm25_index import BM25Retriever
+from custom_retriever import CustomRetriever
+from document_parser import DocumentParser
+from ingest_jobs import IngestJob
+from model_registry import ModelRegistry, registry
+from onnx_embedding import ONNXEmbedding
+
+
+class StubLLM(CustomLLM):
+    """Deterministic stand-in for Gemini, so queries can be benchmarked offline.
+
+    Answers are derived from a hash of the prompt. Router prompts get a valid
+    selection, and `latency` seconds of simulated generation time can be added
+    to each call without blocking the event loop.
+    """
+
+    latency: float = 0.0
+    answer_words: int = 128
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="stub", is_chat_model=False)
+
+    def _answer(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        # The router asks to pick one of N numbered choices and expects JSON back
+        choices = re.search(r"numbered list \(1 to (\d+)\)", prompt)
+        if choices:
+            choice = int(digest[:8], 16) % int(choices.group(1)) + 1
+            return json.dumps([{"choice": choice, "reason": "stub"}])
+        words = [digest[i % 56:i % 56 + 8] for i in range(self.answer_words)]
+        return " ".join(words)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.latency)
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        time.sleep(self.latency)
+
+        def gen() -> CompletionResponseGen:
+            text = ""
+            for word in self._answer(prompt).split(" "):
+                text += word + " "
+                yield CompletionResponse(text=text, delta=word + " ")
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        await asyncio.sleep(self.latency)
+        return CompletionResponse(text=self._answer(prompt))
+
+
+# Vocabulary for synthetic judgments, close enough to the real corpus for the tokenizers and BM25
+ACTS = [
+    ("Arbitration and Conciliation Act, 1996", ["9", "11", "34", "36", "37"]),
+    ("Commercial Courts Act, 2015", ["2(1)(c)", "6", "12A", "13"]),
+    ("Code of Civil Procedure, 1908", ["9", "10", "80", "151"]),
+    ("Indian Contract Act, 1872", ["10", "23", "73", "74"]),
+    ("Specific Relief Act, 1963", ["10", "14", "20", "38"]),
+    ("Limitation Act, 1963", ["3", "5", "14", "18"]),
+    ("Negotiable Instruments Act, 1881", ["138", "139", "141"]),
+    ("Insolvency and Bankruptcy Code, 2016", ["7", "9", "10A", "14"]),
+]
+COURTS = ["High Court of Delhi", "Bombay High Court", "High Court of Madras", "Supreme Court of India",
+          "Calcutta High Court", "High Court of Karnataka"]
+PARTIES = ["Bharat Infra Projects Ltd.", "Sundaram Textiles Pvt. Ltd.", "Union of India", "Hindustan Steelworks",
+           "Coastal Shipping Corporation", "Meridian Finance Ltd.", "Kaveri Agro Industries", "Apex Telecom Ltd."]
+TERMS = ["arbitral award", "interim injunction", "liquidated damages", "breach of contract", "limitation period",
+         "summary suit", "pre-institution mediation", "specific performance", "bank guarantee", "termination notice",
+         "patent illegality", "public policy", "counter claim", "letter of credit", "force majeure", "security deposit",
+         "commercial dispute", "operational creditor", "dishonour of cheque", "agreement to sell"]
+FILLER = ("the learned counsel for the petitioner submitted that the respondent had failed to perform its obligations "
+          "under the agreement and that the impugned order suffers from an error apparent on the face of the record "
+          "it is well settled that the court will not reappreciate the evidence or substitute its own view for that "
+          "of the tribunal unless the finding is perverse or based on no evidence at all").split()
+
+QUERY_TEMPLATES = [
+    "Can the court set aside an {term} under Section {section} of the {act}?",
+    "What are the grounds for {term} in a dispute under the {act}?",
+    "Is {term} maintainable when Section {section} of the {act} was not complied with?",
+    "Predict the outcome of a claim for {term} against {party}.",
+    "Which cases discuss {term} and Section {section} of the {act}?",
+    "Summarize the judgments on {term} decided by the {court}.",
+]
+
+
+def synthetic_judgment(rng: random.Random, doc_chars: int) -> str:
+    """One judgment-like document of roughly `doc_chars` characters."""
+    act, sections = rng.choice(ACTS)
+    petitioner, respondent = rng.sample(PARTIES, 2)
+    lines = [
+        f"IN THE {rng.choice(COURTS).upper()}",
+        f"{petitioner} ... Petitioner",
+        "versus",
+        f"{respondent} ... Respondent",
+        f"Date of Judgment: {rng.randint(1, 28)}.{rng.randint(1, 12)}.{rng.randint(2000, 2024)}",
+        "",
+    ]
+    size = sum(len(line) for line in lines)
+    paragraph = 1
+    while size < doc_chars:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = rng.sample(FILLER, rng.randint(12, 24))
+            words.insert(rng.randrange(len(words)), rng.choice(TERMS))
+            if rng.random() < 0.5:
+                words.append(f"under Section {rng.choice(sections)} of the {act}")
+            sentences.append(" ".join(words).capitalize() + ".")
+        line = f"{paragraph}. " + " ".join(sentences)
+        lines.append(line)
+        size += len(line)
+        paragraph += 1
+    return "\n\n".join(lines)
+
+
+def write_corpus(directory: str, count: int, doc_chars: int, seed: int) -> List[str]:
+    """Write `count` synthetic judgments; the same seed gives the same files at every scale."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"judgment_{i:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(synthetic_judgment(rng, doc_chars))
+        paths.append(path)
+    return paths
+
+
+def synthetic_queries(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        act, sections = rng.choice(ACTS)
+        queries.append(rng.choice(QUERY_TEMPLATES).format(
+            term=rng.choice(TERMS), section=rng.choice(sections), act=act,
+            party=rng.choice(PARTIES), court=rng.choice(COURTS),
+        ))
+    return queries
+
+
+def percentiles(seconds: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean of a list of durations, in milliseconds."""
+    if not seconds:
+        return {}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def bench_registry() -> ModelRegistry:
+    """The served models, except that embeddings bypass the on-disk cache.
+
+    A cached run would only measure cache lookups, and the corpora of
+    successive scales overlap.
+    """
+    models = ModelRegistry()
+    models.register("embed_model", lambda: registry.get("embed_backend"))
+    models.register("reranker_tokenizer", lambda: registry.get("reranker_tokenizer"))
+    models.register("reranker_model", lambda: registry.get("reranker_model"))
+    return models
+
+
+def bench_ingest(pipeline: RAGPipeline, files: List[str]) -> Dict[str, Any]:
+    job = IngestJob()
+    start = time.perf_counter()
+    pipeline.update_documents(files, progress=job)
+    seconds = time.perf_counter() - start
+    stages = job.to_dict()["stages"]
+    passages = stages["embed"]["total"]
+    return {
+        "docs": len(files),
+        "passages": passages,
+        "seconds": round(seconds, 3),
+        "docs_per_s": round(len(files) / seconds, 2),
+        "stage_seconds": {name: stage["seconds"] for name, stage in stages.items()},
+        "embed_passages_per_s": round(passages / max(stages["embed"]["seconds"], 1e-9), 2),
+    }
+
+
+def bench_first_stage(pipeline: RAGPipeline, queries: List[str]) -> Dict[str, Any]:
+    """Query embedding, then the vector and BM25 searches on their own, with the embedding precomputed."""
+    embed_model = pipeline.models.get("embed_model")
+    vector_retriever = pipeline.vector_index.as_retriever(similarity_top_k=FIRST_STAGE_TOP_K)
+    keyword_retriever = BM25Retriever(
+        pipeline.keyword_index, pipeline.storage_context.docstore, similarity_top_k=FIRST_STAGE_TOP_K
+    )
+    embed_times, vector_times, keyword_times = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        embedding = embed_model.get_query_embedding(query)
+        embed_times.append(time.perf_counter() - start)
+        bundle = QueryBundle(query, embedding=embedding)
+        vector_times.append(timed(vector_retriever.retrieve, bundle))
+        keyword_times.append(timed(keyword_retriever.retrieve, bundle))
+    return {
+        "query_embedding": percentiles(embed_times),
+        "vector": percentiles(vector_times),
+        "keyword": percentiles(keyword_times),
+    }
+
+
+def bench_rerank(pipeline: RAGPipeline, queries: List[str], candidate_counts: List[int]) -> Dict[str, Any]:
+    """Rerank latency for each number of candidates, taken from a deep vector search."""
+    most = max(candidate_counts)
+    candidates = pipeline.vector_index.as_retriever(similarity_top_k=most)
+    retriever = CustomRetriever(
+        vector_retriever=candidates,
+        keyword_retriever=None,
+        tokenizer=pipeline.models.get("reranker_tokenizer"),
+        model=pipeline.models.get("reranker_model"),
+        max_candidates=most,
+        docstore=pipeline.storage_context.docstore,
+    )
+    retrieved = [(query, candidates.retrieve(query)) for query in queries]
+    results = {}
+    for count in candidate_counts:
+        times = [timed(retriever._rerank_with_bert, query, nodes[:count])
+                 for query, nodes in retrieved if len(nodes) >= count]
+        if not times:
+            continue  # the corpus is too small for this many candidates
+        stats = percentiles(times)
+        stats["per_candidate_ms"] = round(stats["mean_ms"] / count, 3)
+        results[str(count)] = stats
+    return results
+
+
+async def bench_end_to_end(pipeline: RAGPipeline, queries: List[str], concurrency: int) -> Dict[str, Any]:
+    """Route, retrieve, rerank and answer each query, `concurrency` at a time.
+
+    The answer cache is bypassed, otherwise repeated queries would be free.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def run(query: str) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await pipeline.query_engine.aquery(query)
+            latencies.append(time.perf_counter() - start)
+
+    await pipeline.query_engine.aquery(queries[0])  # warm-up
+    start = time.perf_counter()
+    await asyncio.gather(*(run(query) for query in queries))
+    seconds = time.perf_counter() - start
+    return dict(percentiles(latencies), queries=len(queries), concurrency=concurrency,
+                queries_per_s=round(len(queries) / seconds, 2))
+
+
+def run_scale(files: List[str], queries: List[str], args, parser: DocumentParser) -> Dict[str, Any]:
+    llm = StubLLM(latency=args.llm_latency, answer_words=args.answer_words)
+    pipeline = RAGPipeline(models=bench_registry(), parser=parser, llm=llm)
+    result = {"ingest": bench_ingest(pipeline, files)}
+    pipeline.create_query_engines()
+    pipeline.create_tools()
+    pipeline.create_router_engine(verbose=False)
+    result["first_stage"] = bench_first_stage(pipeline, queries)
+    result["rerank"] = bench_rerank(pipeline, queries, args.candidates)
+    result["end_to_end"] = asyncio.run(bench_end_to_end(pipeline, queries, args.concurrency))
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(tree: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """Print every metric of both runs with its relative change; rates are better higher, times lower."""
+    before, after = flatten(baseline["scales"]), flatten(current["scales"])
+    print(f"{'metric':<48} {'baseline':>10} {'current':>10} {'change':>8}")
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        change = (new - old) / old * 100 if old else 0.0
+        higher_is_better = key.endswith("_per_s")
+        lower_is_better = key.endswith("_ms") or key.endswith("seconds") or ".stage_seconds." in key
+        flag = ""
+        if abs(change) >= 5 and (higher_is_better or lower_is_better):
+            flag = "better" if (change > 0) == higher_is_better else "worse"
+        print(f"{key:<48} {old:>10.3f} {new:>10.3f} {change:>+7.1f}% {flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval, reranking and queries offline.")
+    parser.add_argument("--scales", default="10,50,200", help="comma separated corpus sizes, in documents")
+    parser.add_argument("--corpus", help="directory of .txt judgments to use instead of synthetic ones")
+    parser.add_argument("--doc-chars", type=int, default=20000, help="size of a synthetic judgment")
+    parser.add_argument("--queries", type=int, default=50, help="queries per scale")
+    parser.add_argument("--concurrency", type=int, default=8, help="queries in flight end to end")
+    parser.add_argument("--candidates", default="8,16,32,64", help="rerank candidate counts")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--answer-words", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json", help="where to write the results")
+    parser.add_argument("--compare", help="results of an earlier run to compare against")
+    args = parser.parse_args()
+    args.candidates = sorted(int(n) for n in args.candidates.split(","))
+    scales = sorted(int(n) for n in args.scales.split(","))
+
+    backend = registry.get("embed_backend")
+    if not isinstance(backend, ONNXEmbedding):
+        print(f"Warning: measuring {backend.model_name}, not the ONNX embedding model; "
+              "run `python onnx_embedding.py --export` first")
+    registry.warm_up()
+
+    queries = synthetic_queries(args.queries, args.seed)
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "embed_model": backend.model_name,
+            "reranker": RERANKER_DIR,
+            "corpus": args.corpus or "synthetic",
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        # A fresh parse cache, so every scale parses its files from scratch
+        document_parser = DocumentParser(cache_dir=os.path.join(tmp, "parsed"))
+        if args.corpus:
+            corpus = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+                            if name.endswith(".txt"))
+        else:
+            os.makedirs(os.path.join(tmp, "corpus"))
+            corpus = write_corpus(os.path.join(tmp, "corpus"), max(scales), args.doc_chars, args.seed)
+        for scale in scales:
+            if scale > len(corpus):
+                print(f"Skipping scale {scale}: the corpus has only {len(corpus)} documents")
+                continue
+            print(f"Benchmarking {scale} documents...")
+            result = run_scale(corpus[:scale], queries, args, document_parser)
+            results["scales"][str(scale)] = result
+            print(f"  ingest {result['ingest']['docs_per_s']} docs/s, "
+                  f"embed {result['ingest']['embed_passages_per_s']} passages/s, "
+                  f"end to end p50 {result['end_to_end']['p50_ms']} ms, "
+                  f"p99 {result['end_to_end']['p99_ms']} ms")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results)
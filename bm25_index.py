@@ -0,0 +1,194 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+
+BM25_ARRAYS_FNAME = "bm25.npz"
+BM25_META_FNAME = "bm25.json"
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his in is it its of on or she that the "
+    "their them they this to was were which will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over nodes, stored as sparse postings in NumPy arrays.
+
+    Documents are kept doc-major (one row of term ids and counts per node),
+    which makes inserts and deletes cheap. Before the first query after a
+    change they are compiled into term-major CSR postings, so a query only
+    touches the postings of its own terms and is scored with vectorized NumPy.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        # node id -> (term ids, term counts)
+        self._docs: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # ref doc id -> node ids, for deletion by document
+        self._ref_docs: Dict[str, List[str]] = {}
+
+        self._lock = threading.Lock()
+        self._compiled = False
+        self._node_ids: List[str] = []
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._postings_doc = np.zeros(0, dtype=np.int32)
+        self._postings_tf = np.zeros(0, dtype=np.float32)
+        self._doc_lengths = np.zeros(0, dtype=np.float32)
+        self._idf = np.zeros(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes held by the per-document term counts and compiled postings."""
+        docs = sum(term_ids.nbytes + counts.nbytes for term_ids, counts in self._docs.values())
+        postings = self._indptr.nbytes + self._postings_doc.nbytes + self._postings_tf.nbytes
+        return docs + postings + self._doc_lengths.nbytes + self._idf.nbytes
+
+    def copy(self) -> "BM25Index":
+        """An index with the same documents that can be changed independently."""
+        with self._lock:
+            index = BM25Index(k1=self.k1, b=self.b)
+            index.vocab = dict(self.vocab)
+            # The per-document arrays are never modified in place, so they are shared
+            index._docs = dict(self._docs)
+            index._ref_docs = {ref_doc_id: list(node_ids) for ref_doc_id, node_ids in self._ref_docs.items()}
+            return index
+
+    def _term_id(self, term: str) -> int:
+        if term not in self.vocab:
+            self.vocab[term] = len(self.vocab)
+        return self.vocab[term]
+
+    def add_nodes(self, nodes: Sequence[BaseNode]) -> None:
+        with self._lock:
+            for node in nodes:
+                term_ids = np.fromiter((self._term_id(t) for t in tokenize(node.get_content())), dtype=np.int32)
+                unique, counts = np.unique(term_ids, return_counts=True)
+                self._docs[node.node_id] = (unique.astype(np.int32), counts.astype(np.int32))
+                if node.ref_doc_id is not None:
+                    self._ref_docs.setdefault(node.ref_doc_id, []).append(node.node_id)
+            self._compiled = False
+
+    def delete_nodes(self, node_ids: Sequence[str]) -> None:
+        with self._lock:
+            for node_id in node_ids:
+                self._docs.pop(node_id, None)
+            self._compiled = False
+
+    def delete_ref_doc(self, ref_doc_id: str) -> None:
+        """Delete every node that was parsed from a document."""
+        self.delete_nodes(self._ref_docs.pop(ref_doc_id, []))
+
+    def _compile(self) -> None:
+        """Rebuild the term-major postings from the per-document term counts."""
+        self._node_ids = list(self._docs)
+        n_docs = len(self._node_ids)
+        if n_docs:
+            term_ids = np.concatenate([self._docs[node_id][0] for node_id in self._node_ids])
+            counts = np.concatenate([self._docs[node_id][1] for node_id in self._node_ids])
+            lengths = np.array([self._docs[node_id][1].sum() for node_id in self._node_ids], dtype=np.float32)
+            doc_idx = np.repeat(np.arange(n_docs, dtype=np.int32), [len(self._docs[n][0]) for n in self._node_ids])
+        else:
+            term_ids = np.zeros(0, dtype=np.int32)
+            counts = np.zeros(0, dtype=np.int32)
+            lengths = np.zeros(0, dtype=np.float32)
+            doc_idx = np.zeros(0, dtype=np.int32)
+
+        order = np.argsort(term_ids, kind="stable")
+        df = np.bincount(term_ids, minlength=len(self.vocab))
+        self._indptr = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+        self._postings_doc = doc_idx[order]
+        self._postings_tf = counts[order].astype(np.float32)
+        self._doc_lengths = lengths
+        self._idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self._compiled = True
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Return up to top_k (node id, BM25 score) pairs with a positive score."""
+        with self._lock:
+            if not self._compiled:
+                self._compile()
+            if not self._node_ids:
+                return []
+
+            term_ids = sorted({self.vocab[t] for t in tokenize(query) if t in self.vocab})
+            scores = np.zeros(len(self._node_ids), dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self._doc_lengths / max(self._doc_lengths.mean(), 1e-9))
+            for term_id in term_ids:
+                start, end = self._indptr[term_id], self._indptr[term_id + 1]
+                docs = self._postings_doc[start:end]
+                tf = self._postings_tf[start:end]
+                scores[docs] += self._idf[term_id] * tf * (self.k1 + 1) / (tf + norm[docs])
+
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            return [(self._node_ids[i], float(scores[i])) for i in candidates]
+
+    def persist(self, persist_dir: str) -> None:
+        with self._lock:
+            node_ids = list(self._docs)
+            lengths = [len(self._docs[node_id][0]) for node_id in node_ids]
+            np.savez_compressed(
+                os.path.join(persist_dir, BM25_ARRAYS_FNAME),
+                indptr=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+                term_ids=np.concatenate([self._docs[n][0] for n in node_ids]) if node_ids else np.zeros(0, np.int32),
+                counts=np.concatenate([self._docs[n][1] for n in node_ids]) if node_ids else np.zeros(0, np.int32),
+            )
+            with open(os.path.join(persist_dir, BM25_META_FNAME), "w", encoding="utf-8") as f:
+                json.dump(
+                    {"k1": self.k1, "b": self.b, "vocab": self.vocab, "node_ids": node_ids, "ref_docs": self._ref_docs},
+                    f,
+                )
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> Optional["BM25Index"]:
+        meta_path = os.path.join(persist_dir, BM25_META_FNAME)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = np.load(os.path.join(persist_dir, BM25_ARRAYS_FNAME))
+
+        index = cls(k1=meta["k1"], b=meta["b"])
+        index.vocab = meta["vocab"]
+        index._ref_docs = meta["ref_docs"]
+        indptr, term_ids, counts = arrays["indptr"], arrays["term_ids"], arrays["counts"]
+        for i, node_id in enumerate(meta["node_ids"]):
+            index._docs[node_id] = (term_ids[indptr[i]:indptr[i + 1]], counts[indptr[i]:indptr[i + 1]])
+        return index
+
+
+class BM25Retriever(BaseRetriever):
+    """Retrieve nodes from a BM25Index, resolving them through the docstore."""
+
+    def __init__(self, index: BM25Index, docstore: BaseDocumentStore, similarity_top_k: int = 20) -> None:
+        self._index = index
+        self._docstore = docstore
+        self._similarity_top_k = similarity_top_k
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        results = []
+        for node_id, score in self._index.search(query_bundle.query_str, self._similarity_top_k):
+            node = self._docstore.get_node(node_id, raise_error=False)
+            if node is not None:
+                results.append(NodeWithScore(node=node, score=score))
+        return results
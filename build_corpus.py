@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import hashlib
+import importlib.util
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from index_store import INDEX_FORMAT_VERSION, IndexStore, build_manifest
+
+BUILD_STATE_PATH = os.path.join(".build", "state.json")
+
+
+def digest(*parts) -> str:
+    """Content address of a stage's inputs: a hash over manifests, file hashes and parameters."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def dir_digest(path: str) -> Dict[str, str]:
+    return build_manifest(input_dir=path) if os.path.isdir(path) else {}
+
+
+def file_digest(path: str) -> Optional[Dict[str, str]]:
+    return build_manifest(input_files=[path]) if os.path.exists(path) else None
+
+
+@dataclass
+class StageResult:
+    items: int = 0
+    cached: int = 0
+    built: int = 0
+    failed: int = 0
+    output: Optional[str] = None
+
+
+@dataclass
+class Stage:
+    """One step of the corpus build.
+
+    `inputs` returns the content address of everything the stage reads and
+    `outputs` that of what it wrote; both are evaluated only once the stages it
+    depends on have finished. A stage whose inputs and outputs both match its
+    last clean run is not run at all. `inputs=None` means the stage always runs.
+    Within a stage, items are cached individually (downloads by document id,
+    summaries by content hash, index snapshots by manifest version).
+    """
+
+    name: str
+    run: Callable[[], StageResult]
+    deps: List[str] = field(default_factory=list)
+    inputs: Optional[Callable[[], str]] = None
+    outputs: Callable[[], str] = lambda: ""
+
+
+class BuildGraph:
+    """Run stages in dependency order, independent stages in parallel."""
+
+    def __init__(self, state_path: str = BUILD_STATE_PATH) -> None:
+        self.state_path = state_path
+        self.stages: Dict[str, Stage] = {}
+        self.state: Dict[str, dict] = {}
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        self.report: Dict[str, dict] = {}
+
+    def add(self, stage: Stage) -> None:
+        self.stages[stage.name] = stage
+
+    def _save_state(self) -> None:
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _run_stage(self, stage: Stage) -> dict:
+        start = time.perf_counter()
+        key = stage.inputs() if stage.inputs is not None else None
+        previous = self.state.get(stage.name, {})
+        if key is not None and previous.get("inputs") == key and previous.get("outputs") == stage.outputs():
+            return {"status": "cached", "seconds": time.perf_counter() - start, "output": previous.get("output")}
+
+        result = stage.run()
+        status = "failed" if result.failed and not result.built and not result.cached else "built"
+        report = {
+            "status": status,
+            "seconds": time.perf_counter() - start,
+            "items": result.items,
+            "cached_items": result.cached,
+            "built_items": result.built,
+            "failed_items": result.failed,
+            "output": result.output,
+        }
+        # Only a clean run is remembered, so failed items are retried next time. The
+        # entry is applied by run() on the main thread, which also writes the state file.
+        if not result.failed:
+            report["state"] = {"inputs": key, "outputs": stage.outputs(), "output": result.output}
+        return report
+
+    def run(self, workers: int = 4) -> Dict[str, dict]:
+        done, pending, running = set(), dict(self.stages), {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="build") as executor:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    failed_deps = [d for d in stage.deps if self.report.get(d, {}).get("status") in ("failed", "skipped")]
+                    if failed_deps:
+                        self.report[name] = {"status": "skipped", "seconds": 0.0, "reason": f"{failed_deps[0]} failed"}
+                        del pending[name]
+                    elif all(d in done or d not in self.stages for d in stage.deps):
+                        running[executor.submit(self._run_stage, stage)] = name
+                        del pending[name]
+                if not running:
+                    if pending:
+                        raise ValueError(f"Stages with circular dependencies: {sorted(pending)}")
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        self.report[name] = future.result()
+                    except Exception as e:
+                        self.report[name] = {"status": "failed", "seconds": 0.0, "reason": str(e)}
+                    if "state" in self.report[name]:
+                        self.state[name] = self.report[name].pop("state")
+                    done.add(name)
+                    self._save_state()
+        return self.report
+
+
+def print_report(report: Dict[str, dict]) -> None:
+    print(f"{'stage':<10} {'status':<8} {'seconds':>8} {'items':>6} {'cached':>6} {'built':>6} {'failed':>6}")
+    items = cached = 0
+    for name, row in report.items():
+        print(
+            f"{name:<10} {row['status']:<8} {row['seconds']:>8.2f} {row.get('items', '-'):>6} "
+            f"{row.get('cached_items', '-'):>6} {row.get('built_items', '-'):>6} {row.get('failed_items', '-'):>6}"
+            + (f"  ({row['reason']})" if "reason" in row else "")
+        )
+        items += row.get("items", 0)
+        cached += row.get("cached_items", 0)
+    stages_cached = sum(row["status"] == "cached" for row in report.values())
+    print(f"stage cache hits: {stages_cached}/{len(report)}, item cache hits: {cached}/{items}")
+
+
+def build_graph(args) -> BuildGraph:
+    graph = BuildGraph()
+
+    if args.harvest:
+        def harvest():
+            from scraping import LinkSet, SearchHarvester
+
+            links = LinkSet(args.links)
+            try:
+                harvester = SearchHarvester(links, base_url=args.base_url, workers=args.workers)
+                counts = asyncio.run(harvester.run(args.query, start_page=args.start_page, max_pages=args.max_pages))
+            finally:
+                links.close()
+            return StageResult(items=counts["links_found"], cached=counts["links_found"] - counts["new_links"],
+                               built=counts["new_links"], failed=counts["failed_pages"], output=args.links)
+
+        # Search results change over time, so harvesting always runs
+        graph.add(Stage("links", harvest))
+
+    def download():
+        from scraping import JudgmentDownloader, read_links
+
+        downloader = JudgmentDownloader(args.cases_dir, base_url=args.base_url, workers=args.workers,
+                                        use_browser=not args.no_browser)
+        counts = asyncio.run(downloader.run(read_links(args.links)))
+        return StageResult(items=counts["documents"], cached=counts["skipped"], built=counts["downloaded"],
+                           failed=counts["failed"], output=args.cases_dir)
+
+    graph.add(Stage(
+        "download", download, deps=["links"],
+        inputs=lambda: digest(file_digest(args.links), args.base_url),
+        outputs=lambda: digest(dir_digest(args.cases_dir)),
+    ))
+
+    def summarize():
+        from data_formatting import BatchSummarizer, FakeClient, GeminiClient
+
+        client = FakeClient() if args.fake_llm else GeminiClient()
+        summarizer = BatchSummarizer(client, args.summaries_dir, workers=args.workers, requests_per_minute=args.rpm)
+        counts = summarizer.run(args.cases_dir)
+        return StageResult(items=counts["summarized"] + counts["skipped"] + len(counts["failed"]),
+                           cached=counts["skipped"], built=counts["summarized"], failed=len(counts["failed"]),
+                           output=args.summaries_dir)
+
+    graph.add(Stage(
+        "summarize", summarize, deps=["download"],
+        inputs=lambda: digest(dir_digest(args.cases_dir), args.fake_llm),
+        outputs=lambda: digest(dir_digest(args.summaries_dir)),
+    ))
+
+    store_dir = os.path.join(os.getenv("INDEX_STORE_DIR", "storage"), f"v{INDEX_FORMAT_VERSION}",
+                             os.path.basename(os.path.normpath(args.summaries_dir)))
+
+    def index():
+        from agent import INDEX_STORE_DIR, RAGPipeline
+
+        llm = None
+        if args.fake_llm:
+            from benchmark import StubLLM
+
+            llm = StubLLM()
+        store = IndexStore(root=INDEX_STORE_DIR, name=os.path.basename(os.path.normpath(args.summaries_dir)))
+        pipeline = RAGPipeline(llm=llm)
+        pipeline.load_or_build(args.summaries_dir, store)
+        cached = store.exists(pipeline.index_version) and pipeline.documents is None
+        return StageResult(items=1, cached=int(cached), built=int(not cached), output=store.path_for(pipeline.index_version))
+
+    def embed_model_name():
+        # The backend that is actually loaded, which falls back to torch without an ONNX
+        # export; the same name goes into RAGPipeline.index_version
+        from agent import embed_model_id
+
+        return embed_model_id()
+
+    graph.add(Stage(
+        "index", index, deps=["summarize"],
+        inputs=lambda: digest(dir_digest(args.summaries_dir), embed_model_name()),
+        # The snapshots present in the store, so a pruned or deleted snapshot is rebuilt
+        outputs=lambda: digest(sorted(os.listdir(store_dir)) if os.path.isdir(store_dir) else []),
+    ))
+
+    if os.path.isdir("data_json") and os.path.exists("data.csv"):
+        def pairs():
+            # The script's name is not a valid module name, so load it by path
+            spec = importlib.util.spec_from_file_location("query_case_mapping", "query-case-mapping.py")
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            module.main(output_path="fine-tune-data.jsonl")
+            return StageResult(items=1, built=1, output="fine-tune-data.jsonl")
+
+        # Independent of the judgment chain, so it runs alongside it
+        graph.add(Stage(
+            "pairs", pairs,
+            inputs=lambda: digest(dir_digest("data_json"), file_digest("data.csv")),
+            outputs=lambda: digest(file_digest("fine-tune-data.jsonl")),
+        ))
+
+    return graph
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the corpus from links to a served index snapshot.")
+    parser.add_argument("--harvest", action="store_true", help="harvest new links from search results first")
+    parser.add_argument("--query", default="commercial court   doctypes: judgments")
+    parser.add_argument("--start-page", type=int, default=0)
+    parser.add_argument("--max-pages", type=int, default=50)
+    parser.add_argument("--links", default="all_links.txt")
+    parser.add_argument("--cases-dir", default="data")
+    parser.add_argument("--summaries-dir", default="summaries")
+    parser.add_argument("--base-url", default=os.getenv("JUDGMENTS_BASE_URL", "https://indiankanoon.org"))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", type=int, default=15, help="LLM requests per minute")
+    parser.add_argument("--no-browser", action="store_true")
+    parser.add_argument("--fake-llm", action="store_true", help="summarize with a fake LLM, for offline runs")
+    args = parser.parse_args()
+
+    report = build_graph(args).run(workers=args.workers)
+    print_report(report)
@@ -0,0 +1,109 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+# Blocking request-path work (retrieval, ONNX reranking, cache lookups) runs on this pool
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "4"))
+# Index builds (the startup corpus and uploads) take minutes, so they get their own
+# pool and never hold up queries; sized for the ingest limit plus the startup build
+BUILD_THREADS = int(os.getenv("BUILD_THREADS", "3"))
+
+_executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="rag-worker")
+_build_executor = ThreadPoolExecutor(max_workers=BUILD_THREADS, thread_name_prefix="rag-build")
+
+
+def get_executor() -> ThreadPoolExecutor:
+    return _executor
+
+
+async def _run_in(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry context variables over to the worker thread, like asyncio.to_thread does
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, func, *args, **kwargs))
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the shared worker pool without stalling the event loop."""
+    return await _run_in(_executor, func, *args, **kwargs)
+
+
+async def run_build(func, *args, **kwargs):
+    """Run an index build on the build pool, away from the threads that serve queries."""
+    return await _run_in(_build_executor, func, *args, **kwargs)
+
+
+class ConcurrencyLimiter:
+    """Limit how many requests run at once and how many may queue behind them.
+
+    Requests beyond the queue, or that wait longer than `queue_timeout`
+    seconds, are rejected with a 503 so clients can back off and retry.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: Optional[float] = None) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._waiting = 0
+
+    def _busy(self) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+    async def acquire(self) -> None:
+        """Wait for a free slot, raising a 503 HTTPException if the queue is full."""
+        if self._semaphore.locked() and self._waiting >= self.max_queued:
+            raise self._busy()
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._busy()
+        finally:
+            self._waiting -= 1
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    async def __aenter__(self) -> "ConcurrencyLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+class LimitedStreamingResponse(StreamingResponse):
+    """Streaming response that holds a ConcurrencyLimiter slot until it is done.
+
+    The slot, acquired by the caller, is released exactly once when the
+    response finishes, fails or the client goes away, even if the body was
+    never iterated.
+    """
+
+    def __init__(self, content, limiter: ConcurrencyLimiter, **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self._limiter = limiter
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._limiter.release()
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
@@ -0,0 +1,104 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Set
+
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.utils import get_tokenizer
+
+CONTEXT_SEPARATOR = "\n\n"
+
+
+@dataclass
+class PackedContext:
+    """The context string handed to the LLM and how it was assembled."""
+
+    text: str
+    nodes: List[NodeWithScore] = field(default_factory=list)
+    tokens_used: int = 0
+    duplicates_dropped: int = 0
+    over_budget_dropped: int = 0
+    truncated: bool = False
+
+
+class ContextBuilder:
+    """Pack retrieved nodes into a context string that fits a token budget.
+
+    Nodes are taken in order of their (reranker) score. A node whose word
+    shingles overlap an already packed node by `duplicate_threshold` or more
+    is skipped. The first node that no longer fits is trimmed to the space
+    that is left, provided at least `min_chunk_tokens` remain, and every
+    lower-scored node after it is dropped.
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        duplicate_threshold: float = 0.8,
+        min_chunk_tokens: int = 64,
+        tokenizer: Optional[Callable[[str], List]] = None,
+    ) -> None:
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.min_chunk_tokens = min_chunk_tokens
+        self._tokenizer = tokenizer or get_tokenizer()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._tokenizer(text))
+
+    @staticmethod
+    def _shingles(text: str, size: int = 3) -> Set[str]:
+        words = re.findall(r"\w+", text.lower())
+        return {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+    def _is_duplicate(self, shingles: Set[str], packed: List[Set[str]]) -> bool:
+        for other in packed:
+            union = len(shingles | other)
+            if union and len(shingles & other) / union >= self.duplicate_threshold:
+                return True
+        return False
+
+    def _trim(self, text: str, max_tokens: int) -> str:
+        """Cut text at a word boundary so that it fits in max_tokens."""
+        tokens = self.count_tokens(text)
+        while tokens > max_tokens and text:
+            cut = max(int(len(text) * max_tokens / tokens) - 1, 0)
+            text = text[:cut].rsplit(None, 1)[0] if " " in text[:cut] else text[:cut]
+            tokens = self.count_tokens(text)
+        return text
+
+    def build(self, nodes: List[NodeWithScore]) -> PackedContext:
+        # Stable sort, so nodes without a score keep their retrieval order
+        ranked = sorted(nodes, key=lambda n: n.score if n.score is not None else float("-inf"), reverse=True)
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)
+
+        packed = PackedContext(text="")
+        parts: List[str] = []
+        packed_shingles: List[Set[str]] = []
+        for i, node in enumerate(ranked):
+            content = node.node.get_content()
+            shingles = self._shingles(content)
+            if self._is_duplicate(shingles, packed_shingles):
+                packed.duplicates_dropped += 1
+                continue
+
+            cost = self.count_tokens(content) + (separator_tokens if parts else 0)
+            remaining = self.token_budget - packed.tokens_used
+            if cost > remaining:
+                room = remaining - (separator_tokens if parts else 0)
+                if room >= self.min_chunk_tokens:
+                    content = self._trim(content, room)
+                    cost = self.count_tokens(content) + (separator_tokens if parts else 0)
+                    parts.append(content)
+                    packed.nodes.append(node)
+                    packed.tokens_used += cost
+                    packed.truncated = True
+                packed.over_budget_dropped = len(ranked) - i - (1 if packed.truncated else 0)
+                break
+
+            parts.append(content)
+            packed_shingles.append(shingles)
+            packed.nodes.append(node)
+            packed.tokens_used += cost
+
+        packed.text = CONTEXT_SEPARATOR.join(parts)
+        return packed
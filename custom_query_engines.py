@@ -1,15 +1,94 @@
+import logging
+from typing import AsyncGenerator, List, Tuple
+
 from llama_index.core import PromptTemplate
 from llama_index.core.query_engine import CustomQueryEngine
 from llama_index.core.retrievers import BaseRetriever
 from llama_index.core.response_synthesizers import BaseSynthesizer
-from llama_index.llms.gemini import Gemini
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.base.llms.types import CompletionResponse
+from llama_index.core.base.response.schema import Response
+from llama_index.core.llms import LLM
+from concurrency import run_blocking
+from context_builder import ContextBuilder, PackedContext
+from telemetry import record_candidates, record_prompt_tokens, span
+
+logger = logging.getLogger(__name__)
 
 
+class ContextQueryEngine(CustomQueryEngine):
+    """Query engine that packs the retrieved nodes into `qa_prompt` and asks the LLM.
+
+    The context is limited to `token_budget` tokens, see ContextBuilder.
+    """
 
-class SummaryQueryEngine(CustomQueryEngine):
     retriever: BaseRetriever
     synthesizer: BaseSynthesizer
-    llm: Gemini
+    llm: LLM
+    qa_prompt: PromptTemplate
+    token_budget: int = 8000
+
+    def _build_prompt(self, nodes: List[NodeWithScore], query_str: str) -> Tuple[str, PackedContext]:
+        with span("context"):
+            builder = ContextBuilder(self.token_budget)
+            context = builder.build(nodes)
+            prompt = self.qa_prompt.format(context_str=context.text, query_str=query_str)
+        logger.info(
+            "%s packed %d/%d nodes into %d context tokens (%d duplicates, %d over budget)",
+            type(self).__name__, len(context.nodes), len(nodes), context.tokens_used,
+            context.duplicates_dropped, context.over_budget_dropped,
+        )
+        record_candidates("context", len(context.nodes))
+        record_prompt_tokens(type(self).__name__, builder.count_tokens(prompt))
+        return prompt, context
+
+    @staticmethod
+    def _to_response(response, context: PackedContext) -> Response:
+        return Response(
+            response=str(response),
+            source_nodes=context.nodes,
+            metadata={"context_tokens": context.tokens_used, "context_truncated": context.truncated},
+        )
+
+    def custom_query(self, query_str: str):
+        with span("retrieve"):
+            nodes = self.retriever.retrieve(query_str)
+
+        prompt, context = self._build_prompt(nodes, query_str)
+        with span("llm"):
+            response = self.llm.complete(prompt)
+
+        return self._to_response(response, context)
+
+    async def acustom_query(self, query_str: str):
+        # Retrieval is CPU bound, so it runs on the worker pool while the LLM call is awaited
+        with span("retrieve"):
+            nodes = await run_blocking(self.retriever.retrieve, query_str)
+
+        prompt, context = await run_blocking(self._build_prompt, nodes, query_str)
+        with span("llm"):
+            response = await self.llm.acomplete(prompt)
+
+        return self._to_response(response, context)
+
+    async def astream_query(
+        self, query_str: str
+    ) -> Tuple[List[NodeWithScore], AsyncGenerator[CompletionResponse, None]]:
+        """Retrieve the context, then return the nodes and a stream of answer tokens."""
+        with span("retrieve"):
+            nodes = await run_blocking(self.retriever.retrieve, query_str)
+
+        prompt, context = await run_blocking(self._build_prompt, nodes, query_str)
+        # Only until the stream is open; reading the tokens is timed by the consumer
+        with span("llm"):
+            token_stream = await self.llm.astream_complete(prompt)
+
+        return context.nodes, token_stream
+
+
+class SummaryQueryEngine(ContextQueryEngine):
+    # Case summaries need most of the judgment, so this engine gets a larger budget
+    token_budget: int = 30000
     qa_prompt: PromptTemplate = PromptTemplate(
         '''
 
@@ -72,21 +151,8 @@ class SummaryQueryEngine(CustomQueryEngine):
             '''
         )
 
-    def custom_query(self, query_str: str):
-        nodes = self.retriever.retrieve(query_str)
-
-        context_str = "\n\n".join([n.node.get_content() for n in nodes])
-        response = self.llm.complete(
-            self.qa_prompt.format(context_str=context_str, query_str=query_str)
-    )
-
-        return str(response)
-    
 
-class VectorQueryEngine(CustomQueryEngine):
-    retriever: BaseRetriever
-    synthesizer: BaseSynthesizer
-    llm: Gemini
+class VectorQueryEngine(ContextQueryEngine):
     qa_prompt: PromptTemplate = PromptTemplate(
         '''
         "Context information is below.\n"
@@ -110,13 +176,3 @@ class VectorQueryEngine(CustomQueryEngine):
         --------------------------------
         '''
     )
-
-    def custom_query(self, query_str: str):
-        nodes = self.retriever.retrieve(query_str)
-
-        context_str = "\n\n".join([n.node.get_content() for n in nodes])
-        response = self.llm.complete(
-            self.qa_prompt.format(context_str=context_str, query_str=query_str)
-        )
-
-        return str(response)
\ No newline at end of file
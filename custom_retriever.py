@@ -1,6 +1,11 @@
 from transformers import AutoTokenizer
 from optimum.onnxruntime import ORTModelForSequenceClassification
 
+import contextvars
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import numpy as np
 import torch
 from llama_index.core.retrievers import (
     BaseRetriever,
@@ -12,30 +17,62 @@ from transformers import BertTokenizer, BertForSequenceClassification
 import torch
 from llama_index.core import QueryBundle
 from llama_index.core.schema import NodeWithScore
-from typing import List
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+from typing import Any, List, Optional, Tuple
+from telemetry import annotate, record_candidates, span
+
+logger = logging.getLogger(__name__)
+
+# Shared by every CustomRetriever so the vector and keyword lookups can overlap
+_first_stage_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="first-stage")
 
 class CustomRetriever(BaseRetriever):
-    """Custom retriever that performs both semantic search and hybrid search with BERT reranking."""
+    """Custom retriever that performs both semantic search and hybrid search with BERT reranking.
+
+    When a docstore is given, the retrieved nodes are treated as small passages:
+    each passage is reranked on its own and its parent chunk is returned, scored
+    with the best score among its passages.
+    """
 
     def __init__(
         self,
         vector_retriever: VectorIndexRetriever,
         keyword_retriever: KeywordTableSimpleRetriever,
-        bert_model: str = "nlpaueb/legal-bert-base-uncased",
+        bert_model: str = "onnx/",
         mode: str = "AND",
+        rerank_top_k: int = 5,
+        rerank_batch_size: int = 16,
+        max_candidates: int = 32,
+        vector_timeout: Optional[float] = None,
+        keyword_timeout: Optional[float] = None,
+        docstore: Optional[BaseDocumentStore] = None,
+        rrf_k: int = 60,
+        tokenizer: Optional[Any] = None,
+        model: Optional[Any] = None,
     ) -> None:
-        """Initialize retriever with vector, keyword retrievers, and BERT for reranking."""
+        """Initialize retriever with vector, keyword retrievers, and BERT for reranking.
+
+        Pass an already loaded tokenizer and model to share them between retrievers;
+        otherwise they are loaded from `bert_model`.
+        """
         
         self._vector_retriever = vector_retriever
         self._keyword_retriever = keyword_retriever
-        if mode not in ("AND", "OR"):
-            raise ValueError("Invalid mode. Must be 'AND' or 'OR'.")
+        if mode not in ("AND", "OR", "RRF"):
+            raise ValueError("Invalid mode. Must be 'AND', 'OR' or 'RRF'.")
         self._mode = mode
+        self._rerank_top_k = rerank_top_k
+        self._rerank_batch_size = rerank_batch_size
+        self._max_candidates = max_candidates
+        self._vector_timeout = vector_timeout
+        self._keyword_timeout = keyword_timeout
+        self._docstore = docstore
+        self._rrf_k = rrf_k
         
         # Load the BERT model for reranking
-        self.tokenizer = AutoTokenizer.from_pretrained("onnx/")
+        self.tokenizer = tokenizer or AutoTokenizer.from_pretrained(bert_model)
 
-        self.model = ORTModelForSequenceClassification.from_pretrained("onnx/", file_name='model_quantized.onnx')
+        self.model = model or ORTModelForSequenceClassification.from_pretrained(bert_model, file_name='model_quantized.onnx')
         
         super().__init__()
 
@@ -49,39 +86,136 @@ class CustomRetriever(BaseRetriever):
     def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
         """Retrieve nodes given query using both vector and keyword retrievers, then rerank with BERT."""
         
-        # Perform initial retrieval with vector and keyword retrievers
-        vector_nodes = self._vector_retriever.retrieve(query_bundle)
-        keyword_nodes = self._keyword_retriever.retrieve(query_bundle)
-        
-        # Create a dictionary to combine nodes from both retrievers
-        vector_ids = {n.node.node_id for n in vector_nodes}
-        keyword_ids = {n.node.node_id for n in keyword_nodes}
-        combined_dict = {n.node.node_id: n for n in vector_nodes}
-        combined_dict.update({n.node.node_id: n for n in keyword_nodes})
-        
-        # Decide which nodes to return based on the mode
-        if self._mode == "AND":
-            retrieve_ids = vector_ids.intersection(keyword_ids)
+        # Perform initial retrieval with vector and keyword retrievers in parallel
+        start = time.monotonic()
+        vector_future = self._submit(self._vector_retriever, query_bundle, "vector")
+        keyword_future = self._submit(self._keyword_retriever, query_bundle, "keyword")
+        vector_nodes = self._collect(vector_future, start, self._vector_timeout, "vector")
+        keyword_nodes = self._collect(keyword_future, start, self._keyword_timeout, "keyword")
+        record_candidates("vector", len(vector_nodes or []))
+        record_candidates("keyword", len(keyword_nodes or []))
+
+        if vector_nodes is None or keyword_nodes is None:
+            # A branch timed out, fall back to whatever the other one found
+            retrieve_nodes = vector_nodes or keyword_nodes or []
+        elif self._mode == "RRF":
+            with span("retrieve.fuse"):
+                retrieve_nodes = self._fuse_rrf([vector_nodes, keyword_nodes])
         else:
-            retrieve_ids = vector_ids.union(keyword_ids)
-        
-        # Get the combined nodes to be reranked
-        retrieve_nodes = [combined_dict[rid] for rid in retrieve_ids]
+            # Create a dictionary to combine nodes from both retrievers
+            vector_ids = {n.node.node_id for n in vector_nodes}
+            keyword_ids = {n.node.node_id for n in keyword_nodes}
+            combined_dict = {n.node.node_id: n for n in vector_nodes}
+            combined_dict.update({n.node.node_id: n for n in keyword_nodes})
+
+            # Decide which nodes to return based on the mode
+            if self._mode == "AND":
+                retrieve_ids = vector_ids.intersection(keyword_ids)
+            else:
+                retrieve_ids = vector_ids.union(keyword_ids)
+
+            # Get the combined nodes to be reranked
+            retrieve_nodes = [combined_dict[rid] for rid in retrieve_ids]
 
         # Rerank the retrieved nodes using BERT
         reranked_nodes = self._rerank_with_bert(query_bundle.query_str, retrieve_nodes)
         
         return reranked_nodes
 
+    def _fuse_rrf(self, rankings: List[List[NodeWithScore]]) -> List[NodeWithScore]:
+        """Fuse ranked lists by reciprocal rank into at most max_candidates nodes."""
+        fused = {}
+        for ranking in rankings:
+            ranked = sorted(ranking, key=lambda n: n.score or 0.0, reverse=True)
+            for rank, node in enumerate(ranked):
+                node_id = node.node.node_id
+                score = fused[node_id].score if node_id in fused else 0.0
+                fused[node_id] = NodeWithScore(node=node.node, score=score + 1.0 / (self._rrf_k + rank + 1))
+        return sorted(fused.values(), key=lambda n: n.score, reverse=True)[:self._max_candidates]
+
+    @staticmethod
+    def _submit(retriever: BaseRetriever, query_bundle: QueryBundle, name: str) -> Future:
+        """Run a first-stage retriever on the shared pool, keeping the caller's context."""
+        def retrieve() -> List[NodeWithScore]:
+            # Timed on the worker, so a branch's span covers only its own search
+            with span(f"retrieve.{name}"):
+                return retriever.retrieve(query_bundle)
+
+        ctx = contextvars.copy_context()
+        return _first_stage_pool.submit(ctx.run, retrieve)
+
+    @staticmethod
+    def _collect(future: Future, start: float, timeout: Optional[float], name: str) -> Optional[List[NodeWithScore]]:
+        """Wait for a first-stage result until `timeout` seconds after `start`, or return None."""
+        remaining = None if timeout is None else max(0.0, start + timeout - time.monotonic())
+        try:
+            return future.result(timeout=remaining)
+        except FutureTimeoutError:
+            logger.warning("%s retriever timed out after %.2fs, continuing without it", name, timeout)
+            annotate(f"timed_out.{name}", True)
+            return None
+
     def _rerank_with_bert(self, query: str, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
-        """Rerank nodes using BERT scores."""
-        scored_nodes = []
-        for node in nodes:
-            bert_score = self._compute_bert_score(query, node.node.text)
-            scored_nodes.append((node, bert_score))
-        
-        # Sort nodes by BERT score in descending order
-        scored_nodes = sorted(scored_nodes, key=lambda x: x[1], reverse=True)
-        
-        # Return the nodes sorted by relevance
-        return [node for node, score in scored_nodes]
\ No newline at end of file
+        """Rerank nodes using batched BERT scores and keep the top-k."""
+        if not nodes:
+            return []
+
+        # Cap the candidates sent to the reranker, preferring the best first-stage scores
+        nodes = sorted(nodes, key=lambda n: n.score or 0.0, reverse=True)[:self._max_candidates]
+        record_candidates("rerank", len(nodes))
+        with span("rerank"):
+            scores = self._score_with_bert(query, nodes)
+        if self._docstore is not None:
+            nodes, scores = self._pool_to_parents(nodes, scores)
+
+        # Select the top-k without sorting every candidate
+        top_k = min(self._rerank_top_k, len(nodes))
+        top_idx = np.argpartition(-scores, top_k - 1)[:top_k]
+        top_idx = top_idx[np.argsort(-scores[top_idx])]
+
+        # Return the nodes sorted by relevance with their reranker scores attached
+        return [NodeWithScore(node=nodes[i].node, score=float(scores[i])) for i in top_idx]
+
+    def _score_with_bert(self, query: str, nodes: List[NodeWithScore]) -> np.ndarray:
+        """Score every (query, passage) pair with the reranker in padded batches."""
+        # Tokenize all (query, passage) pairs in one call, padding happens per batch
+        encodings = self.tokenizer(
+            [query] * len(nodes),
+            [n.node.text for n in nodes],
+            truncation=True,
+            max_length=512,
+        )
+
+        # Group pairs of similar length together to keep batch padding small
+        order = np.argsort([len(ids) for ids in encodings["input_ids"]])
+        logits = np.empty((len(nodes), 2), dtype=np.float32)
+        for start in range(0, len(order), self._rerank_batch_size):
+            batch_idx = order[start:start + self._rerank_batch_size]
+            batch = self.tokenizer.pad(
+                {key: [values[i] for i in batch_idx] for key, values in encodings.items()},
+                return_tensors='np',
+            )
+            outputs = self.model(**batch)
+            logits[batch_idx] = np.asarray(outputs.logits, dtype=np.float32)
+
+        # Probability of the "relevant" class, computed as a numerically stable softmax
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs[:, 1] / probs.sum(axis=1)
+
+    def _pool_to_parents(self, nodes: List[NodeWithScore], scores: np.ndarray) -> Tuple[List[NodeWithScore], np.ndarray]:
+        """Max-pool passage scores into their parent chunks."""
+        best = {}
+        for node, score in zip(nodes, scores):
+            parent = node.node.parent_node
+            key = parent.node_id if parent is not None else node.node.node_id
+            if key not in best or score > best[key][1]:
+                best[key] = (node, score)
+
+        pooled_nodes, pooled_scores = [], []
+        for key, (node, score) in best.items():
+            # Passages without a parent, or whose parent is missing, stand for themselves
+            parent_node = self._docstore.get_node(key, raise_error=False) if node.node.parent_node else None
+            pooled_nodes.append(NodeWithScore(node=parent_node or node.node, score=float(score)))
+            pooled_scores.append(score)
+        return pooled_nodes, np.asarray(pooled_scores, dtype=np.float32)
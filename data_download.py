@@ -1,38 +1,31 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-# Set up headless Chrome options
-options = Options()
-options.add_argument("--headless=new")
-
-# Initialize the webdriver
-driver = webdriver.Chrome(options=options)
-
-# Read links from the text file
-with open("all_links.txt", "r") as f:
-    links = f.readlines()
-
-# Process each link
-for i, link in enumerate(links):
-    link = link.strip()  # Remove any leading/trailing whitespace
-
-    # Navigate to the URL
-    driver.get(link)
-
-    # Wait for the div with class 'judgments' to be present and visible
-    wait = WebDriverWait(driver, 100)
-    judgments_div = wait.until(EC.visibility_of_element_located((By.CLASS_NAME, 'judgments')))
-
-    # Scroll to the bottom (if needed)
-    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-
-    # Extract the content and write to a file
-    with open(f"case{i + 1}.txt", "w", encoding="utf-8") as outfile:
-        outfile.write(judgments_div.text)
-
-# Close the browser
-driver.quit()
\ No newline at end of file
+import argparse
+import asyncio
+import logging
+
+from scraping import BASE_URL, JudgmentDownloader, read_links
+
+# Download the judgment of every link in all_links.txt, resuming from earlier runs
+parser = argparse.ArgumentParser(description="Download judgment texts for the links in a file.")
+parser.add_argument("--links", default="all_links.txt", help="file with one judgment link or doc id per line")
+parser.add_argument("--output-dir", default="data", help="where <doc id>.txt files and the manifest are written")
+parser.add_argument("--base-url", default=BASE_URL, help="site to download from, e.g. a local stand-in server")
+parser.add_argument("--workers", type=int, default=8, help="concurrent downloads")
+parser.add_argument("--rate", type=float, default=2.0, help="requests per second per host")
+parser.add_argument("--retries", type=int, default=4, help="retries per page before giving up")
+parser.add_argument("--no-browser", action="store_true", help="never fall back to headless Chrome")
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+downloader = JudgmentDownloader(
+    output_dir=args.output_dir,
+    base_url=args.base_url,
+    workers=args.workers,
+    rate=args.rate,
+    retries=args.retries,
+    use_browser=not args.no_browser,
+)
+counts = asyncio.run(downloader.run(read_links(args.links)))
+print(counts)
+for doc_id, error in downloader.failed.items():
+    print(f"{doc_id}: {error}")
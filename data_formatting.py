@@ -1,11 +1,75 @@
-import google.generativeai as genai
-from tqdm import tqdm
+import argparse
+import hashlib
+import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tqdm import tqdm
+
+MODEL_NAME = "gemini-1.5-flash"
+CHECKPOINT_FNAME = ".summaries.json"
+
+
+class GeminiClient:
+    """Summarize with the Gemini API."""
+
+    def __init__(self, model_name=MODEL_NAME):
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.environ['GEMINI_API_KEY'])
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+
+class FakeClient:
+    """Deterministic stand-in for the LLM, for running the stage offline."""
 
-genai.configure(api_key=os.environ['GEMINI_API_KEY'])
-model = genai.GenerativeModel('gemini-1.5-flash')
+    model_name = "fake"
 
-def generate_summary(file):
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def generate(self, prompt):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("fake LLM failure")
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return f"1. Case Title\n\n\t•\tCase Name: fake summary {digest}\n\n{prompt[:500]}"
+
+
+class TokenBucket:
+    """Thread-safe token bucket holding up to `capacity` tokens, refilled at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Block until `amount` tokens are available, then take them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def generate_summary(file, client):
     prompt = f'''{file} \n please go through the above case in complete detail and provide me a contextual summary of the case, A summary of the relevant legal information.\nI want large data. give large contextual summary full detailed case by going through the whole txt file. give proper detailed info of what all happened in the case arguments by appealant, responsdent, judge decisions, etc etc,\nI want everything in detail. all the facts in the case, all relevant sections in the file, all legal principles in the file, each and every cotext in the file \n \n 
     Follow this template for all the summaries like a bible:\n 
     1. Case Title
@@ -57,15 +121,119 @@ def generate_summary(file):
 
 	•	Citations: Full citations of any statutes, cases, or legal texts referenced in the summary.
 	•	Further Reading: Suggestions for further reading or related cases.'''
-    response = model.generate_content(prompt)
-    return response.text
-
-
-files = os.listdir("data")
-print(files)
-
-for file in tqdm(files, desc="Generating Summaries: "):
-    text = open(f'data/{file}', 'r').read()
-    summary = generate_summary(text)
-    with open(f"case_summary{file}", "w", encoding="utf-8") as outfile:
-        outfile.write(summary)
\ No newline at end of file
+    return client.generate(prompt)
+
+
+def write_atomic(path, text):
+    # Hidden, so a half-written file is never picked up as a summary by the index stage
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as outfile:
+        outfile.write(text)
+    os.replace(tmp_path, path)
+
+
+class BatchSummarizer:
+    """Summarize every judgment in a directory with a bounded pool of workers.
+
+    LLM calls are throttled by two token buckets, one for requests and one
+    for (estimated) prompt tokens per minute. A checkpoint in the output
+    directory maps each input file to the hash of its content and the model,
+    so unchanged judgments are skipped on later runs. Failed calls are retried
+    with backoff; files that still fail are reported without stopping the run.
+    """
+
+    def __init__(self, client, output_dir="summaries", workers=4, requests_per_minute=15,
+                 tokens_per_minute=1_000_000, retries=3, backoff=2.0):
+        self.client = client
+        self.output_dir = output_dir
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.request_bucket = TokenBucket(requests_per_minute / 60, max(requests_per_minute / 60, 1))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self.checkpoint_path = os.path.join(output_dir, CHECKPOINT_FNAME)
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+        self.checkpoint = {}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                self.checkpoint = json.load(f)
+
+    def output_path(self, file):
+        return os.path.join(self.output_dir, f"case_summary{file}")
+
+    def content_hash(self, text):
+        # The model is part of the key, so switching models re-summarizes everything
+        return hashlib.sha256(f"{self.client.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def is_current(self, file, text):
+        entry = self.checkpoint.get(file)
+        return (
+            entry is not None
+            and entry["hash"] == self.content_hash(text)
+            and os.path.exists(self.output_path(file))
+        )
+
+    def _summarize(self, file, text):
+        for attempt in range(self.retries + 1):
+            self.request_bucket.acquire()
+            # Roughly four characters per token
+            self.token_bucket.acquire(len(text) // 4)
+            try:
+                return generate_summary(text, self.client)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random() / 2))
+
+    def _process(self, file, text):
+        summary = self._summarize(file, text)
+        write_atomic(self.output_path(file), summary)
+        with self._lock:
+            self.checkpoint[file] = {"hash": self.content_hash(text), "output": self.output_path(file)}
+            write_atomic(self.checkpoint_path, json.dumps(self.checkpoint, indent=2))
+
+    def run(self, input_dir="data"):
+        """Summarize the new or changed files of input_dir and return counts and failures."""
+        pending = {}
+        skipped = 0
+        for file in sorted(os.listdir(input_dir)):
+            # Only judgment texts; skips manifests and half-written .tmp files
+            if not file.endswith(".txt"):
+                continue
+            with open(os.path.join(input_dir, file), "r", encoding="utf-8") as f:
+                text = f.read()
+            if self.is_current(file, text):
+                skipped += 1
+            else:
+                pending[file] = text
+
+        failed = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._process, file, text): file for file, text in pending.items()}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Generating Summaries: "):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed[futures[future]] = str(e)
+
+        return {"summarized": len(pending) - len(failed), "skipped": skipped, "failed": failed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize case files with an LLM.")
+    parser.add_argument("--input-dir", default="data")
+    parser.add_argument("--output-dir", default="summaries")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", type=int, default=15, help="LLM requests per minute")
+    parser.add_argument("--tpm", type=int, default=1_000_000, help="LLM prompt tokens per minute")
+    parser.add_argument("--fake", action="store_true", help="use a fake LLM, for offline runs")
+    args = parser.parse_args()
+
+    client = FakeClient() if args.fake else GeminiClient()
+    summarizer = BatchSummarizer(client, args.output_dir, args.workers, args.rpm, args.tpm)
+    result = summarizer.run(args.input_dir)
+    print(f"Summarized {result['summarized']}, skipped {result['skipped']} unchanged, failed {len(result['failed'])}")
+    for file, error in result["failed"].items():
+        print(f"  {file}: {error}")
@@ -0,0 +1,122 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+
+from index_store import hash_file
+
+logger = logging.getLogger(__name__)
+
+# Plain text needs no extraction, so it is read in-process and not cached
+INLINE_EXTENSIONS = (".txt",)
+
+
+def _parse_file(path: str) -> dict:
+    """Parse one file into serialized documents; runs in a worker process."""
+    documents = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+    return {"path": path, "documents": [document.to_dict() for document in documents]}
+
+
+def _restore(path: str, parsed: dict) -> List[Document]:
+    """Rebuild the parsed documents, possibly parsed from identical content under another path."""
+    documents = []
+    file_metadata = default_file_metadata_func(path)
+    for data in parsed["documents"]:
+        document = Document.from_dict(data)
+        # Keep the id scheme of filename_as_id=True: the path plus e.g. "_part_0"
+        document.id_ = path + document.id_[len(parsed["path"]):]
+        document.metadata.update(file_metadata)
+        documents.append(document)
+    return documents
+
+
+class DocumentParser:
+    """Parse uploaded files on a process pool, caching parsed text by file hash.
+
+    Each file is its own task, so a large PDF does not hold up the rest of a
+    batch, and re-uploading a file whose content was already parsed skips
+    extraction entirely.
+    """
+
+    def __init__(self, cache_dir: str = "parsed_cache", max_workers: Optional[int] = None) -> None:
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or max(os.cpu_count() - 1, 1)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Spawn rather than fork: the server process runs threads and ONNX sessions
+                self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _cache_path(self, file_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{file_hash}.json")
+
+    def _read_cache(self, file_hash: str) -> Optional[dict]:
+        try:
+            with open(self._cache_path(file_hash), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_cache(self, file_hash: str, parsed: dict) -> None:
+        if not parsed["documents"]:
+            return  # the reader skipped the file, do not remember the failure
+        tmp_path = f"{self._cache_path(file_hash)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(parsed, f)
+        os.replace(tmp_path, self._cache_path(file_hash))
+
+    def parse(
+        self,
+        paths: List[str],
+        hashes: Optional[Dict[str, str]] = None,
+        on_parsed: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, List[Document]]:
+        """Parse files into documents, keyed by path.
+
+        `hashes` may hold already computed file hashes; `on_parsed` is called
+        with each path as soon as that file is done.
+        """
+        on_parsed = on_parsed or (lambda path: None)
+        hashes = dict(hashes or {})
+        results: Dict[str, List[Document]] = {}
+        futures = {}
+        cached = 0
+        for path in paths:
+            if path.endswith(INLINE_EXTENSIONS):
+                results[path] = _restore(path, _parse_file(path))
+                on_parsed(path)
+                continue
+            file_hash = hashes.get(path) or hash_file(path)
+            hashes[path] = file_hash
+            parsed = self._read_cache(file_hash)
+            if parsed is not None:
+                cached += 1
+                results[path] = _restore(path, parsed)
+                on_parsed(path)
+            else:
+                futures[self._get_pool().submit(_parse_file, path)] = path
+
+        for future in as_completed(futures):
+            path = futures[future]
+            parsed = future.result()
+            self._write_cache(hashes[path], parsed)
+            results[path] = _restore(path, parsed)
+            on_parsed(path)
+
+        self.hits += cached
+        self.misses += len(futures)
+        logger.info("Parsed %d files, %d from cache, %d on the process pool", len(paths), cached, len(futures))
+        return results
@@ -0,0 +1,311 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+INDEX_FNAME = "index.json"
+VECTORS_FNAME = "vectors.f32"
+ROW_KEYS_FNAME = "row_keys.bin"
+CACHE_FORMAT_VERSION = 2
+KEY_BYTES = 32
+
+_open_caches: Dict[str, "EmbeddingCache"] = {}
+_open_caches_lock = threading.Lock()
+
+
+def open_cache(cache_dir: str, max_entries: int = 100_000) -> "EmbeddingCache":
+    """Return the process-wide cache for a directory, so two users never map the same files."""
+    key = os.path.abspath(cache_dir)
+    with _open_caches_lock:
+        if key not in _open_caches:
+            _open_caches[key] = EmbeddingCache(cache_dir, max_entries=max_entries)
+        return _open_caches[key]
+
+
+class EmbeddingCache:
+    """Size-bounded, content-addressed embedding store on disk.
+
+    Vectors live in a float32 memory-mapped matrix with one row per entry and a
+    small JSON index maps each key to its row. When the matrix is full the
+    least recently used rows are evicted and reused.
+
+    The index is only written every `flush_interval` seconds, so each row also
+    records the key it holds, in a memory-mapped file next to the vectors. On
+    load, index entries whose row now holds another key (or a half-written
+    one) are dropped. A crash between flushes therefore loses entries but
+    never serves the wrong vector.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 100_000, flush_interval: float = 5.0) -> None:
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # Serializes index writes, which happen outside _lock
+        self._flush_lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._row_keys: List[Optional[str]] = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._clock = 0
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._stored_keys: Optional[np.memmap] = None
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(model_name: str, kind: str, text: str) -> str:
+        """Key an embedding by model name, embedding kind and a hash of the text."""
+        return hashlib.sha256(f"{model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _load(self) -> None:
+        index_path = os.path.join(self.cache_dir, INDEX_FNAME)
+        paths = [index_path] + [os.path.join(self.cache_dir, name) for name in (VECTORS_FNAME, ROW_KEYS_FNAME)]
+        if not all(os.path.exists(path) for path in paths):
+            return
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        # A cache written with a different capacity or format is discarded rather than converted
+        if index.get("max_entries") != self.max_entries or index.get("version") != CACHE_FORMAT_VERSION:
+            return
+
+        self._open_vectors(index["dim"], mode="r+")
+        self._clock = index["clock"]
+        dropped = 0
+        for row, (key, last_used) in enumerate(zip(index["keys"], index["last_used"])):
+            if key is None:
+                continue
+            # The row was reused (or was being written) after the index was last flushed
+            if self._stored_keys[row].tobytes() != bytes.fromhex(key):
+                dropped += 1
+                continue
+            self._rows[key] = row
+            self._row_keys[row] = key
+            self._last_used[row] = last_used
+        if dropped:
+            # Rows are expected to be filled in order, see _free_rows; compact the survivors
+            self._compact()
+
+    def _compact(self) -> None:
+        """Move the occupied rows to the front of the matrix."""
+        occupied = sorted(self._rows.values())
+        for new_row, old_row in enumerate(occupied):
+            if new_row == old_row:
+                continue
+            key = self._row_keys[old_row]
+            self._write_row(new_row, key, self._vectors[old_row].copy())
+            self._last_used[new_row] = self._last_used[old_row]
+            self._rows[key] = new_row
+            self._row_keys[new_row] = key
+            self._row_keys[old_row] = None
+            self._last_used[old_row] = 0
+        self._dirty = True
+
+    def _open_vectors(self, dim: int, mode: str) -> None:
+        self._dim = dim
+        self._vectors = np.memmap(
+            os.path.join(self.cache_dir, VECTORS_FNAME),
+            dtype=np.float32,
+            mode=mode,
+            shape=(self.max_entries, dim),
+        )
+        self._stored_keys = np.memmap(
+            os.path.join(self.cache_dir, ROW_KEYS_FNAME),
+            dtype=np.uint8,
+            mode=mode,
+            shape=(self.max_entries, KEY_BYTES),
+        )
+
+    def _write_row(self, row: int, key: str, embedding) -> None:
+        # Invalidate the row's key first, so an interrupted write is never taken for a valid entry
+        self._stored_keys[row] = 0
+        self._vectors[row] = embedding
+        self._stored_keys[row] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Embedding]]:
+        """Look up several keys, returning None for the ones that are not cached."""
+        results: List[Optional[Embedding]] = []
+        with self._lock:
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self.hits += 1
+                self._clock += 1
+                self._last_used[row] = self._clock
+                results.append(self._vectors[row].tolist())
+        return results
+
+    def put_many(self, keys: List[str], embeddings: List[Embedding]) -> None:
+        """Store embeddings, evicting the least recently used entries when full."""
+        if not keys:
+            return
+        # A batch larger than the whole cache only keeps its tail
+        keys, embeddings = keys[-self.max_entries:], embeddings[-self.max_entries:]
+        with self._lock:
+            if self._vectors is None:
+                self._open_vectors(len(embeddings[0]), mode="w+")
+
+            unique_keys = list(dict.fromkeys(keys))
+            new_keys = [key for key in unique_keys if key not in self._rows]
+            # Entries this batch rewrites must not be evicted to make room for it
+            batch_rows = [self._rows[key] for key in unique_keys if key in self._rows]
+            free_rows = self._free_rows(len(new_keys), batch_rows)
+            for key, embedding in zip(keys, embeddings):
+                row = self._rows.get(key)
+                if row is None:
+                    row = free_rows.pop()
+                    self._rows[key] = row
+                    self._row_keys[row] = key
+                self._clock += 1
+                self._last_used[row] = self._clock
+                self._write_row(row, key, embedding)
+            self._dirty = True
+            flush_due = time.monotonic() - self._last_flush > self.flush_interval
+
+        if flush_due:
+            self.flush()
+
+    def _free_rows(self, count: int, keep: List[int]) -> List[int]:
+        """Return `count` unused rows, evicting the least recently used ones other than `keep` if needed."""
+        # Rows are filled in order, so rows [0, size) are exactly the occupied ones
+        size = len(self._rows)
+        free = list(range(size, min(size + count, self.max_entries)))
+        missing = count - len(free)
+        if missing > 0:
+            last_used = self._last_used[:size].copy()
+            last_used[keep] = np.iinfo(np.int64).max
+            evict = np.argpartition(last_used, missing - 1)[:missing]
+            for row in evict.tolist():
+                del self._rows[self._row_keys[row]]
+                self._row_keys[row] = None
+                self._last_used[row] = 0
+                free.append(row)
+        return free[::-1]
+
+    def flush(self) -> None:
+        """Write the vectors and the key index to disk.
+
+        Only a snapshot of the index is taken under the lock; it is serialized
+        and written outside it, so lookups are not held up by the write.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._last_flush = time.monotonic()
+                if not self._dirty or self._vectors is None:
+                    return
+                index = {
+                    "version": CACHE_FORMAT_VERSION,
+                    "dim": self._dim,
+                    "max_entries": self.max_entries,
+                    "clock": self._clock,
+                    "keys": list(self._row_keys),
+                    "last_used": self._last_used.tolist(),
+                }
+                self._dirty = False
+
+            try:
+                self._vectors.flush()
+                self._stored_keys.flush()
+                index_path = os.path.join(self.cache_dir, INDEX_FNAME)
+                tmp_path = index_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(index, f)
+                os.replace(tmp_path, index_path)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that serves repeated texts from an EmbeddingCache."""
+
+    base_model: BaseEmbedding = Field(description="The embedding model to cache.")
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, base_model: BaseEmbedding, cache: EmbeddingCache, **kwargs) -> None:
+        super().__init__(
+            base_model=base_model,
+            model_name=base_model.model_name,
+            embed_batch_size=base_model.embed_batch_size,
+            **kwargs,
+        )
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _key(self, kind: str, text: str) -> str:
+        return EmbeddingCache.make_key(self.model_name, kind, text)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = self._key("query", query)
+        cached = self._cache.get_many([key])[0]
+        if cached is not None:
+            return cached
+        embedding = self.base_model._get_query_embedding(query)
+        self._cache.put_many([key], [embedding])
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        key = self._key("query", query)
+        cached = self._cache.get_many([key])[0]
+        if cached is not None:
+            return cached
+        embedding = await self.base_model._aget_query_embedding(query)
+        self._cache.put_many([key], [embedding])
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _lookup(self, texts: List[str]):
+        keys = [self._key("text", text) for text in texts]
+        embeddings = self._cache.get_many(keys)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        return keys, embeddings, missing
+
+    def _store(self, keys, embeddings, missing, computed) -> List[Embedding]:
+        for i, embedding in zip(missing, computed):
+            embeddings[i] = embedding
+        self._cache.put_many([keys[i] for i in missing], computed)
+        return embeddings
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, embeddings, missing = self._lookup(texts)
+        if not missing:
+            return embeddings
+        computed = self.base_model._get_text_embeddings([texts[i] for i in missing])
+        return self._store(keys, embeddings, missing, computed)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, embeddings, missing = self._lookup(texts)
+        if not missing:
+            return embeddings
+        computed = await self.base_model._aget_text_embeddings([texts[i] for i in missing])
+        return self._store(keys, embeddings, missing, computed)
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+
+from llama_index.core import StorageContext
+
+from bm25_index import BM25Index
+from matrix_vector_store import MatrixVectorStore
+
+# Bump this whenever the layout of the persisted indices changes
+INDEX_FORMAT_VERSION = 4
+MANIFEST_FNAME = "manifest.json"
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(input_dir: Optional[str] = None, input_files: Optional[List[str]] = None) -> Dict[str, str]:
+    """Map every source file of a corpus to the hash of its content."""
+    paths = list(input_files or [])
+    if input_dir:
+        for root, _, files in os.walk(input_dir):
+            paths.extend(os.path.join(root, name) for name in files if not name.startswith("."))
+    return {os.path.normpath(path): hash_file(path) for path in sorted(paths)}
+
+
+def manifest_version(manifest: Dict[str, str]) -> str:
+    """Derive a short, stable version id from a manifest."""
+    payload = json.dumps({"format": INDEX_FORMAT_VERSION, "files": manifest}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class IndexStore:
+    """Versioned on-disk store for the indices built by RAGPipeline.
+
+    Every corpus version lives in its own directory named after the hash of
+    its manifest, so a changed source file produces a new version instead of
+    overwriting the indices that are currently being served.
+    """
+
+    def __init__(self, root: str = "storage", name: str = "summaries", keep_versions: int = 2) -> None:
+        self.base_dir = os.path.join(root, f"v{INDEX_FORMAT_VERSION}", name)
+        self.keep_versions = keep_versions
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def path_for(self, version: str) -> str:
+        return os.path.join(self.base_dir, version)
+
+    def exists(self, version: str) -> bool:
+        """A version only counts as saved once its manifest has been written."""
+        return os.path.exists(os.path.join(self.path_for(version), MANIFEST_FNAME))
+
+    def load(self, version: str) -> StorageContext:
+        """Load the storage context persisted for a version, memory-mapping its vectors."""
+        persist_dir = self.path_for(version)
+        return StorageContext.from_defaults(
+            persist_dir=persist_dir,
+            vector_store=MatrixVectorStore.from_persist_dir(persist_dir),
+        )
+
+    def load_bm25(self, version: str) -> Optional[BM25Index]:
+        """Load the BM25 index persisted next to the other indices of a version."""
+        return BM25Index.from_persist_dir(self.path_for(version))
+
+    def save(
+        self,
+        storage_context: StorageContext,
+        manifest: Dict[str, str],
+        version: str,
+        bm25_index: Optional[BM25Index] = None,
+    ) -> str:
+        """Persist a storage context, its BM25 index and its manifest, then prune old versions."""
+        # Write into a scratch directory first so readers never see a partial version
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.base_dir)
+        try:
+            storage_context.persist(persist_dir=tmp_dir)
+            if bm25_index is not None:
+                bm25_index.persist(tmp_dir)
+            with open(os.path.join(tmp_dir, MANIFEST_FNAME), "w", encoding="utf-8") as f:
+                json.dump({"version": version, "format": INDEX_FORMAT_VERSION, "files": manifest}, f, indent=2)
+
+            target = self.path_for(version)
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.replace(tmp_dir, target)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self._prune(keep=version)
+        return version
+
+    def _prune(self, keep: str) -> None:
+        """Remove the oldest versions beyond keep_versions."""
+        versions = [
+            entry for entry in os.listdir(self.base_dir)
+            if not entry.startswith(".") and entry != keep and self.exists(entry)
+        ]
+        versions.sort(key=lambda entry: os.path.getmtime(self.path_for(entry)), reverse=True)
+        for entry in versions[max(self.keep_versions - 1, 0):]:
+            shutil.rmtree(self.path_for(entry), ignore_errors=True)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class NullProgress:
+    """Progress sink that ignores every update, for indexing outside a job."""
+
+    def start(self, stage: str, total: int) -> None:
+        pass
+
+    def advance(self, stage: str, n: int = 1) -> None:
+        pass
+
+
+class IngestJob(NullProgress):
+    """Status of one background ingestion, updated from worker threads.
+
+    Stages are reported in the order they start, each with a done/total
+    count, elapsed time and an ETA extrapolated from its rate so far.
+    """
+
+    def __init__(self, session_id: Optional[str] = None) -> None:
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.result: Dict[str, Any] = {}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._stages: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, stage: str, total: int) -> None:
+        with self._lock:
+            self._stages[stage] = {"done": 0, "total": total, "started": time.monotonic(), "finished": None}
+            if total == 0:
+                self._stages[stage]["finished"] = self._stages[stage]["started"]
+
+    def advance(self, stage: str, n: int = 1) -> None:
+        with self._lock:
+            state = self._stages[stage]
+            state["done"] = min(state["done"] + n, state["total"])
+            if state["done"] == state["total"]:
+                state["finished"] = time.monotonic()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        stages = {}
+        with self._lock:
+            for name, state in self._stages.items():
+                elapsed = (state["finished"] or now) - state["started"]
+                remaining = state["total"] - state["done"]
+                eta = None
+                if state["finished"]:
+                    eta = 0.0
+                elif state["done"]:
+                    eta = elapsed / state["done"] * remaining
+                stages[name] = {
+                    "done": state["done"],
+                    "total": state["total"],
+                    "seconds": round(elapsed, 3),
+                    "eta_seconds": None if eta is None else round(eta, 3),
+                }
+        running = [s for s in stages.values() if s["eta_seconds"] != 0.0]
+        return {
+            "job_id": self.job_id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "error": self.error,
+            "stage": next((name for name, s in stages.items() if s["eta_seconds"] != 0.0), None),
+            "stages": stages,
+            # Only the stages reported so far; later stages start once these are done
+            "eta_seconds": None if any(s["eta_seconds"] is None for s in running) else round(
+                sum(s["eta_seconds"] for s in running), 3),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+        }
+
+
+class JobManager:
+    """Run ingestion jobs in the background, at most `max_concurrent` at a time.
+
+    Finished jobs are kept for status polling; beyond `max_finished` the
+    oldest ones are forgotten.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_finished: int = 100) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_finished = max_finished
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._tasks = set()
+
+    def submit(self, run: Callable[[IngestJob], Awaitable[Optional[Dict[str, Any]]]],
+               session_id: Optional[str] = None) -> IngestJob:
+        """Queue `run(job)`, which reports its progress on the job, and return the job at once."""
+        job = IngestJob(session_id)
+        self._jobs[job.job_id] = job
+        task = asyncio.create_task(self._run(job, run))
+        # Keep a reference so the task is not garbage collected while it runs
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._prune()
+        return job
+
+    async def _run(self, job: IngestJob, run: Callable[[IngestJob], Awaitable[Optional[Dict[str, Any]]]]) -> None:
+        async with self._semaphore:
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await run(job) or {}
+                job.status = "done"
+            except Exception as e:
+                logger.exception("Ingestion job %s failed", job.job_id)
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
@@ -0,0 +1,294 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+logger = logging.getLogger(__name__)
+
+MATRIX_FNAME = "matrix_vectors.npy"
+MATRIX_META_FNAME = "matrix_vectors.json"
+IVF_FNAME = "matrix_ivf.npz"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class MatrixVectorStore(BasePydanticVectorStore):
+    """Vector store that keeps every embedding in one contiguous float32 matrix.
+
+    Rows are L2-normalized on insert, so an exact top-k search is a single
+    matrix-vector product followed by `argpartition`. Persisted matrices are
+    memory-mapped on load. Once the store holds `ivf_threshold` vectors an
+    inverted-file index (spherical k-means) is built and queries only scan
+    the `nprobe` closest clusters; its recall@k against exact search is
+    measured and logged every time it is built.
+
+    Node text lives in the docstore, only ids and embeddings are kept here.
+    """
+
+    stores_text: bool = False
+    ivf_threshold: int = 50_000
+    n_lists: Optional[int] = None
+    nprobe: int = 8
+
+    _lock: Any = PrivateAttr()
+    _matrix: np.ndarray = PrivateAttr()
+    _size: int = PrivateAttr()
+    _ids: List[str] = PrivateAttr()
+    _ref_doc_ids: List[Optional[str]] = PrivateAttr()
+    _centroids: Optional[np.ndarray] = PrivateAttr()
+    _assignments: Optional[np.ndarray] = PrivateAttr()
+    _lists: Optional[tuple] = PrivateAttr()
+    _last_recall: Optional[float] = PrivateAttr()
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._size = 0
+        self._ids = []
+        self._ref_doc_ids = []
+        self._centroids = None
+        self._assignments = None
+        self._lists = None
+        self._last_recall = None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MatrixVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @property
+    def last_recall(self) -> Optional[float]:
+        """Recall@k of the approximate index against exact search, measured when it was built."""
+        return self._last_recall
+
+    @property
+    def size(self) -> int:
+        # Not __len__: an empty store must stay truthy for StorageContext.from_defaults
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the matrix, including rows reserved for growth."""
+        return self._matrix.nbytes
+
+    def _reserve(self, extra: int, dim: int) -> None:
+        """Grow the matrix geometrically; this also copies a read-only memory map into RAM."""
+        needed = self._size + extra
+        if needed <= self._matrix.shape[0] and self._matrix.flags.writeable:
+            return
+        capacity = max(needed, 2 * self._matrix.shape[0], 1024)
+        grown = np.zeros((capacity, dim), dtype=np.float32)
+        if self._size:
+            grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = _normalize(np.asarray([node.get_embedding() for node in nodes], dtype=np.float32))
+        with self._lock:
+            self._reserve(len(nodes), vectors.shape[1])
+            self._matrix[self._size:self._size + len(nodes)] = vectors
+            self._size += len(nodes)
+            self._ids.extend(node.node_id for node in nodes)
+            self._ref_doc_ids.extend(node.ref_doc_id for node in nodes)
+
+            if self._centroids is not None:
+                # Extend the existing clustering instead of rebuilding it
+                new_assignments = np.argmax(vectors @ self._centroids.T, axis=1)
+                self._assignments = np.concatenate([self._assignments, new_assignments])
+                self._lists = None
+            elif self._size >= self.ivf_threshold:
+                self.build_ivf()
+        return [node.node_id for node in nodes]
+
+    def copy(self) -> "MatrixVectorStore":
+        """A store with the same vectors that can be changed independently.
+
+        The matrix is shared read-only and only copied once either store adds
+        rows to it; deletes already build a new matrix.
+        """
+        with self._lock:
+            store = MatrixVectorStore(ivf_threshold=self.ivf_threshold, n_lists=self.n_lists, nprobe=self.nprobe)
+            matrix = self._matrix[:self._size].view()
+            matrix.flags.writeable = False
+            store._matrix = matrix
+            store._size = self._size
+            store._ids = list(self._ids)
+            store._ref_doc_ids = list(self._ref_doc_ids)
+            store._centroids = self._centroids
+            store._assignments = self._assignments
+            store._last_recall = self._last_recall
+            return store
+
+    def _delete_rows(self, keep: np.ndarray) -> None:
+        self._matrix = self._matrix[:self._size][keep]
+        self._size = int(keep.sum())
+        self._ids = [node_id for node_id, k in zip(self._ids, keep) if k]
+        self._ref_doc_ids = [ref_id for ref_id, k in zip(self._ref_doc_ids, keep) if k]
+        if self._assignments is not None:
+            self._assignments = self._assignments[keep]
+            self._lists = None
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            keep = np.array([ref_id != ref_doc_id for ref_id in self._ref_doc_ids], dtype=bool)
+            if not keep.all():
+                self._delete_rows(keep)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Any = None, **delete_kwargs: Any) -> None:
+        if not node_ids:
+            return
+        with self._lock:
+            node_ids = set(node_ids)
+            keep = np.array([node_id not in node_ids for node_id in self._ids], dtype=bool)
+            if not keep.all():
+                self._delete_rows(keep)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._delete_rows(np.zeros(self._size, dtype=bool))
+            self._centroids = None
+            self._assignments = None
+
+    def build_ivf(self, n_iter: int = 10, sample_size: int = 100_000, seed: int = 0) -> None:
+        """Cluster the stored vectors with spherical k-means and measure recall against exact search."""
+        with self._lock:
+            vectors = self._matrix[:self._size]
+            n_lists = self.n_lists or max(int(np.sqrt(self._size)), 1)
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(self._size, size=min(sample_size, self._size), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=min(n_lists, len(sample)), replace=False)].copy()
+            for _ in range(n_iter):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(len(centroids)):
+                    members = sample[labels == c]
+                    if len(members):
+                        centroids[c] = members.sum(axis=0)
+                centroids = _normalize(centroids)
+
+            self._centroids = centroids
+            self._assignments = np.argmax(vectors @ centroids.T, axis=1)
+            self._lists = None
+            self._last_recall = self.evaluate_recall()
+            logger.info(
+                "Built IVF index: %d vectors, %d lists, nprobe=%d, recall@10=%.3f",
+                self._size, len(centroids), self.nprobe, self._last_recall,
+            )
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind="stable")
+            counts = np.bincount(self._assignments, minlength=len(self._centroids))
+            self._lists = (order, np.concatenate([[0], np.cumsum(counts)]))
+        return self._lists
+
+    def _exact_top_k(self, query: np.ndarray, k: int, rows: Optional[np.ndarray] = None):
+        matrix = self._matrix[:self._size] if rows is None else self._matrix[rows]
+        scores = matrix @ query
+        k = min(k, len(scores))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return (top if rows is None else rows[top]), scores[top]
+
+    def _approximate_top_k(self, query: np.ndarray, k: int):
+        order, indptr = self._inverted_lists()
+        nprobe = min(self.nprobe, len(self._centroids))
+        probe = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([order[indptr[c]:indptr[c + 1]] for c in probe])
+        return self._exact_top_k(query, k, rows)
+
+    def evaluate_recall(self, k: int = 10, n_queries: int = 100, seed: int = 0) -> float:
+        """Recall@k of the IVF search against exact search, using stored vectors as queries."""
+        with self._lock:
+            if self._centroids is None or self._size == 0:
+                return 1.0
+            rng = np.random.default_rng(seed)
+            queries = self._matrix[rng.choice(self._size, size=min(n_queries, self._size), replace=False)]
+            hits = total = 0
+            for query in queries:
+                exact, _ = self._exact_top_k(query, k)
+                approx, _ = self._approximate_top_k(query, k)
+                hits += len(np.intersect1d(exact, approx))
+                total += len(exact)
+            return hits / max(total, 1)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("MatrixVectorStore does not support metadata filters.")
+        q = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        with self._lock:
+            if self._size == 0:
+                return VectorStoreQueryResult(ids=[], similarities=[])
+
+            restrict = query.node_ids or query.doc_ids
+            if restrict:
+                allowed = set(restrict)
+                keys = self._ids if query.node_ids else self._ref_doc_ids
+                rows = np.array([i for i, key in enumerate(keys) if key in allowed], dtype=np.int64)
+                top, scores = self._exact_top_k(q, query.similarity_top_k, rows)
+            elif self._centroids is not None:
+                top, scores = self._approximate_top_k(q, query.similarity_top_k)
+            else:
+                top, scores = self._exact_top_k(q, query.similarity_top_k)
+
+            return VectorStoreQueryResult(
+                ids=[self._ids[i] for i in top],
+                similarities=[float(s) for s in scores],
+            )
+
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        """Write the matrix next to the other files of the storage context."""
+        persist_dir = os.path.dirname(persist_path)
+        with self._lock:
+            np.save(os.path.join(persist_dir, MATRIX_FNAME), self._matrix[:self._size])
+            with open(os.path.join(persist_dir, MATRIX_META_FNAME), "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "ids": self._ids,
+                        "ref_doc_ids": self._ref_doc_ids,
+                        "ivf_threshold": self.ivf_threshold,
+                        "n_lists": self.n_lists,
+                        "nprobe": self.nprobe,
+                    },
+                    f,
+                )
+            if self._centroids is not None:
+                np.savez(os.path.join(persist_dir, IVF_FNAME), centroids=self._centroids, assignments=self._assignments)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "MatrixVectorStore":
+        """Load a persisted store, memory-mapping the matrix instead of reading it."""
+        with open(os.path.join(persist_dir, MATRIX_META_FNAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        store = cls(ivf_threshold=meta["ivf_threshold"], n_lists=meta["n_lists"], nprobe=meta["nprobe"])
+        store._matrix = np.load(os.path.join(persist_dir, MATRIX_FNAME), mmap_mode="r")
+        store._size = store._matrix.shape[0]
+        store._ids = meta["ids"]
+        store._ref_doc_ids = meta["ref_doc_ids"]
+
+        ivf_path = os.path.join(persist_dir, IVF_FNAME)
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            store._centroids = ivf["centroids"]
+            store._assignments = ivf["assignments"]
+        return store
@@ -0,0 +1,70 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Load every model and tokenizer once per process and share it.
+
+    Models are registered with a loader and an optional warm-up callback.
+    `get` loads a model on first use; `warm_up` loads all of them and runs
+    their warm-up callbacks up front (e.g. from a startup hook), after which
+    the registry reports itself ready.
+    """
+
+    def __init__(self) -> None:
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._warm_ups: Dict[str, Optional[Callable[[Any], Any]]] = {}
+        self._models: Dict[str, Any] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._ready = False
+
+    def register(self, name: str, loader: Callable[[], Any], warm_up: Optional[Callable[[Any], Any]] = None) -> None:
+        with self._lock:
+            self._loaders[name] = loader
+            self._warm_ups[name] = warm_up
+
+    def get(self, name: str) -> Any:
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        # Re-entrant, so a loader may get() the models it wraps
+        with self._lock:
+            if name not in self._models:
+                if name not in self._loaders:
+                    raise KeyError(f"No model registered under '{name}'.")
+                start = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self._load_seconds[name] = time.perf_counter() - start
+                logger.info("Loaded %s in %.2fs", name, self._load_seconds[name])
+            return self._models[name]
+
+    def warm_up(self) -> None:
+        """Load every registered model and run one dummy inference through it."""
+        for name in list(self._loaders):
+            model = self.get(name)
+            warm_up = self._warm_ups.get(name)
+            if warm_up is not None:
+                start = time.perf_counter()
+                warm_up(model)
+                logger.info("Warmed up %s in %.2fs", name, time.perf_counter() - start)
+        self._ready = True
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self._ready,
+            "loaded": {name: round(seconds, 3) for name, seconds in self._load_seconds.items()},
+            "pending": [name for name in self._loaders if name not in self._models],
+        }
+
+
+# Shared by every pipeline in the process
+registry = ModelRegistry()
@@ -0,0 +1,148 @@
+import argparse
+import time
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_EMBED_DIR = "onnx-embed/"
+
+
+def export_embedding_model(model_name: str = EMBED_MODEL_NAME, save_directory: str = ONNX_EMBED_DIR) -> None:
+    """Export the embedding model to ONNX and int8-quantize it, like the reranker in onnx/."""
+    ort_model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    ort_model.save_pretrained(save_directory)
+    tokenizer.save_pretrained(save_directory)
+
+    # Dynamic quantization writes model_quantized.onnx next to model.onnx
+    quantizer = ORTQuantizer.from_pretrained(save_directory)
+    qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=save_directory, quantization_config=qconfig)
+    print(f"ONNX embedding model saved in {save_directory}")
+
+
+class ONNXEmbedding(BaseEmbedding):
+    """Sentence embeddings from a quantized ONNX export of a sentence-transformers model.
+
+    Texts are tokenized once, sorted by length and embedded in batches padded
+    only to the longest text of each batch, then mean-pooled and normalized
+    the same way sentence-transformers does for all-MiniLM-L6-v2.
+    """
+
+    model_path: str = Field(default=ONNX_EMBED_DIR, description="Directory of the exported model.")
+    file_name: str = Field(default="model_quantized.onnx", description="ONNX file to load.")
+    max_length: int = Field(default=512, description="Maximum tokens per text; longer texts are truncated.")
+    batch_size: int = Field(default=32, description="Texts per ONNX Runtime call.")
+
+    _model: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+
+    def __init__(self, model_path: str = ONNX_EMBED_DIR, **kwargs: Any) -> None:
+        # Large outer batches let length sorting group similar texts across more of the corpus
+        kwargs.setdefault("embed_batch_size", 256)
+        kwargs.setdefault("model_name", f"{EMBED_MODEL_NAME}:onnx-int8")
+        super().__init__(model_path=model_path, **kwargs)
+        self._tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self._model = ORTModelForFeatureExtraction.from_pretrained(model_path, file_name=self.file_name)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ONNXEmbedding"
+
+    def _embed(self, texts: List[str]) -> List[Embedding]:
+        encodings = self._tokenizer(texts, truncation=True, max_length=self.max_length)
+        order = np.argsort([len(ids) for ids in encodings["input_ids"]])
+
+        embeddings = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch_idx = order[start:start + self.batch_size]
+            batch = self._tokenizer.pad(
+                {key: [values[i] for i in batch_idx] for key, values in encodings.items()},
+                return_tensors="np",
+            )
+            hidden = np.asarray(self._model(**batch).last_hidden_state, dtype=np.float32)
+
+            # Mean pooling over real tokens, then L2 normalization
+            mask = batch["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+            if embeddings.shape[1] == 0:
+                embeddings = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            embeddings[batch_idx] = pooled
+        return embeddings.tolist()
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed(texts)
+
+
+def compare_with_torch(
+    texts: List[str], model_path: str = ONNX_EMBED_DIR, max_length: int = 512, min_cosine: float = 0.99
+) -> None:
+    """Check the ONNX embeddings against the torch model and compare their throughput.
+
+    Raises RuntimeError if any text's ONNX embedding is less similar than
+    `min_cosine` to its torch embedding.
+    """
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    backends = {
+        "torch": HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, max_length=max_length),
+        "onnx-int8": ONNXEmbedding(model_path=model_path, max_length=max_length),
+    }
+    results = {}
+    for name, model in backends.items():
+        model.get_text_embedding_batch(texts[:8])  # warm-up
+        start = time.perf_counter()
+        results[name] = np.asarray(model.get_text_embedding_batch(texts), dtype=np.float32)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10}: {len(texts) / elapsed:8.1f} texts/s")
+
+    torch_emb, onnx_emb = results["torch"], results["onnx-int8"]
+    cosine = (torch_emb * onnx_emb).sum(axis=1) / (
+        np.linalg.norm(torch_emb, axis=1) * np.linalg.norm(onnx_emb, axis=1)
+    )
+    print(f"cosine similarity to torch: mean {cosine.mean():.4f}, min {cosine.min():.4f}")
+    if cosine.min() < min_cosine:
+        worst = int(cosine.argmin())
+        raise RuntimeError(
+            f"ONNX embeddings diverge from torch: cosine {cosine.min():.4f} < {min_cosine} on text {worst} "
+            f"({texts[worst][:80]!r})"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and check the ONNX embedding model.")
+    parser.add_argument("--export", action="store_true", help="export and quantize the model first")
+    parser.add_argument("--compare", default="summaries", help="directory of .txt files to compare on")
+    parser.add_argument("--limit", type=int, default=256, help="number of passages to compare")
+    parser.add_argument("--passage-size", type=int, default=320, help="passage size to split into, as served")
+    parser.add_argument("--max-length", type=int, default=480, help="tokens embedded per passage, as served")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="fail below this cosine similarity to torch")
+    args = parser.parse_args()
+
+    if args.export:
+        export_embedding_model()
+
+    from llama_index.core import SimpleDirectoryReader
+    from llama_index.core.node_parser import SentenceSplitter
+
+    documents = SimpleDirectoryReader(input_dir=args.compare).load_data()
+    passages = SentenceSplitter(chunk_size=args.passage_size).get_nodes_from_documents(documents)
+    compare_with_torch([p.get_content() for p in passages[:args.limit]], max_length=args.max_length,
+                       min_cosine=args.min_cosine)
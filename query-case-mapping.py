@@ -1,82 +1,87 @@
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 import os
 import json
-import random
-
-# List to store all queries
-queries = []
-
-# Iterate through all files in the directory
-for filename in os.listdir('data_json'):
-    if filename.endswith('.json'):
-        filepath = os.path.join("data_json", filename)
-        
-        # Open and read the file
-        with open(filepath, 'r') as file:
-            data = json.load(file)
-            
-            # Extract queries
-            for case in data:
-                query = case.get('Query')
-                if query:
-                    queries.append(query)
-
-
-# Load the cases from the CSV file
-csv_file_path = 'data.csv'  # Update with the path to your CSV file
-cases_df = pd.read_csv(csv_file_path)
-cases_df = cases_df.dropna()
-
-
-# Extract relevant columns
-case_ids = cases_df['Case ID'].tolist()
-case_titles = cases_df['Title'].tolist()
-case_texts = cases_df['Key Issues'].tolist()
-print(len(case_texts))
+
+
+def load_queries(data_dir='data_json'):
+    # List to store all queries
+    queries = []
+
+    # Iterate through all files in the directory
+    for filename in os.listdir(data_dir):
+        if filename.endswith('.json'):
+            filepath = os.path.join(data_dir, filename)
+
+            # Open and read the file
+            with open(filepath, 'r') as file:
+                data = json.load(file)
+
+                # Extract queries
+                for case in data:
+                    query = case.get('Query')
+                    if query:
+                        queries.append(query)
+
+    # A query seen twice would map to the same cases, keep it once
+    return list(dict.fromkeys(queries))
+
+
+def load_cases(csv_file_path='data.csv'):
+    # Load the cases from the CSV file
+    cases_df = pd.read_csv(csv_file_path)
+    cases_df = cases_df.dropna()
+
+    # Extract relevant columns
+    return cases_df['Case ID'].tolist(), cases_df['Title'].tolist(), cases_df['Key Issues'].tolist()
+
 
 # Function to map queries to cases
-def map_queries_to_cases(queries, case_texts, case_titles, case_ids, top_n=3):
-    # Combine case texts and queries for vectorization
-    combined_texts = case_texts + queries
-    
-    # Initialize TF-IDF Vectorizer
-    vectorizer = TfidfVectorizer().fit_transform(combined_texts)
-    vectors = vectorizer.toarray()
-    
-    # Calculate cosine similarity between queries and cases
-    cosine_similarities = cosine_similarity(vectors[len(case_texts):], vectors[:len(case_texts)])
-    
-    # Map each query to top_n relevant cases
-    query_mappings = {}
-    for i, query in enumerate(queries):
-        # Get indices of the most similar cases
-        relevant_indices = cosine_similarities[i].argsort()[-top_n:][::-1]
-
-        # Get indices of the least similar 7 cases
-        similarity_threshold = 0.3  # Define your threshold for irrelevance
-        irrelevant_indices = [idx for idx in cosine_similarities[i].argsort()[:7] 
-                    if cosine_similarities[i][idx] < similarity_threshold]
-        
-        # Map query to case IDs and titles
-        relevant_case_list = [(case_texts[index], 1)for index in relevant_indices]
-        irrelevant_case_list = [(case_texts[index], 0) for index in irrelevant_indices]
-        query_mappings[query] = relevant_case_list + irrelevant_case_list
-    
-    return query_mappings
-
-# Map the queries to relevant cases
-mapped_queries = map_queries_to_cases(queries, case_texts, case_titles, case_ids, top_n=3)
-
-# Output the mapping results
-for query, cases in list(mapped_queries.items())[-2:]:
-    print(f"Query: {query}")
-    # for case_id, case_title in cases:
-    #     print(f"  Relevant Case ID: {case_id}, Title: {case_title}")
-    print()
-
-
-# Save the mapping results to a JSON file
-with open('fine-tune-data.json', 'w') as file:
-    json.dump(mapped_queries, file, indent=4)
\ No newline at end of file
+def map_queries_to_cases(queries, case_texts, top_n=3, bottom_n=7, similarity_threshold=0.3, block_size=1024):
+    """Yield (query, [(case text, label), ...]) with the top_n most similar cases labelled 1
+    and up to bottom_n least similar cases below similarity_threshold labelled 0.
+
+    The TF-IDF matrix stays sparse; similarities are computed one block of
+    queries at a time, so memory is bounded by block_size x number of cases.
+    """
+    # TF-IDF rows are L2-normalized, so cosine similarity is a plain dot product
+    vectors = TfidfVectorizer().fit_transform(case_texts + queries).tocsr()
+    case_vectors_t = vectors[:len(case_texts)].T.tocsc()
+    query_vectors = vectors[len(case_texts):]
+
+    top_n = min(top_n, len(case_texts))
+    bottom_n = min(bottom_n, len(case_texts))
+    for start in range(0, len(queries), block_size):
+        similarities = (query_vectors[start:start + block_size] @ case_vectors_t).toarray()
+        for row, query in zip(similarities, queries[start:start + block_size]):
+            # Most similar cases, best first
+            relevant_indices = np.argpartition(-row, top_n - 1)[:top_n]
+            relevant_indices = relevant_indices[np.argsort(-row[relevant_indices])]
+
+            # Least similar cases, least similar first, as long as they are below the threshold
+            irrelevant_indices = np.argpartition(row, bottom_n - 1)[:bottom_n]
+            irrelevant_indices = irrelevant_indices[np.argsort(row[irrelevant_indices])]
+            irrelevant_indices = [idx for idx in irrelevant_indices if row[idx] < similarity_threshold]
+
+            relevant_case_list = [(case_texts[index], 1) for index in relevant_indices]
+            irrelevant_case_list = [(case_texts[index], 0) for index in irrelevant_indices]
+            yield query, relevant_case_list + irrelevant_case_list
+
+
+def main(output_path='fine-tune-data.jsonl'):
+    queries = load_queries()
+    case_ids, case_titles, case_texts = load_cases()
+    print(len(case_texts))
+
+    # Stream the fine-tuning pairs to a JSON Lines file, one query per line
+    count = 0
+    with open(output_path, 'w') as file:
+        for query, cases in map_queries_to_cases(queries, case_texts, top_n=3):
+            file.write(json.dumps({"query": query, "cases": cases}) + "\n")
+            count += 1
+    print(f"Wrote {count} queries to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote, urlparse
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# Point this at a local stand-in server to exercise the scrapers offline
+BASE_URL = os.getenv("JUDGMENTS_BASE_URL", "https://indiankanoon.org")
+MANIFEST_FNAME = "manifest.jsonl"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_DOC_ID = re.compile(r"/doc/(\d+)")
+
+
+def doc_id_from_link(link: str) -> Optional[str]:
+    """Extract the document id from a judgment URL, a '/doc/<id>/' path or a bare id."""
+    link = link.strip()
+    if link.isdigit():
+        return link
+    match = _DOC_ID.search(link)
+    return match.group(1) if match else None
+
+
+def doc_url(doc_id: str, base_url: str = BASE_URL) -> str:
+    return f"{base_url.rstrip('/')}/doc/{doc_id}/"
+
+
+def extract_judgment(html: str) -> Optional[str]:
+    """Return the text of the 'judgments' div, or None if the page does not have one."""
+    div = BeautifulSoup(html, "html.parser").find("div", class_="judgments")
+    if div is None:
+        return None
+    text = div.get_text("\n", strip=True)
+    return text or None
+
+
+def extract_result_links(html: str) -> List[str]:
+    """Return the document ids linked from the 'result' divs of a search results page."""
+    doc_ids = []
+    for div in BeautifulSoup(html, "html.parser").find_all("div", class_="result"):
+        link = div.find("a", href=True)
+        doc_id = doc_id_from_link(link["href"]) if link else None
+        if doc_id:
+            doc_ids.append(doc_id)
+    return doc_ids
+
+
+def search_url(query: str, page_num: int, base_url: str = BASE_URL) -> str:
+    url = f"{base_url.rstrip('/')}/search/?formInput={quote(query)}"
+    return url if page_num == 0 else f"{url}&pagenum={page_num}"
+
+
+def write_atomic(path: str, text: str) -> None:
+    """Write a file so that readers, and reruns after a crash, never see it half-written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class HostRateLimiter:
+    """Space out requests to the same host by at least 1 / `rate` seconds."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, url: str) -> None:
+        host = urlparse(url).netloc
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def fetch(
+    session: aiohttp.ClientSession,
+    url: str,
+    limiter: HostRateLimiter,
+    retries: int = 4,
+    backoff: float = 1.0,
+) -> str:
+    """GET a page, retrying connection errors, timeouts and 429/5xx responses with exponential backoff."""
+    for attempt in range(retries + 1):
+        await limiter.wait(url)
+        delay = backoff * 2 ** attempt * (1 + random.random() / 2)
+        try:
+            async with session.get(url) as response:
+                if response.status not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return await response.text()
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                error = f"HTTP {response.status}"
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+            error = repr(e)
+        if attempt == retries:
+            raise RuntimeError(f"Giving up on {url} after {retries + 1} attempts: {error}")
+        logger.info("Retrying %s in %.1fs (%s)", url, delay, error)
+        await asyncio.sleep(delay)
+
+
+class BrowserFallback:
+    """Headless Chrome for pages whose judgment text only appears after JavaScript runs.
+
+    The driver is started on first use and driven from a single thread, since
+    a Selenium session is not safe to share between threads.
+    """
+
+    def __init__(self, timeout: float = 100) -> None:
+        self.timeout = timeout
+        self._driver = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="browser")
+
+    def _fetch(self, url: str) -> str:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        if self._driver is None:
+            options = Options()
+            options.add_argument("--headless=new")
+            self._driver = webdriver.Chrome(options=options)
+        self._driver.get(url)
+        judgments_div = WebDriverWait(self._driver, self.timeout).until(
+            EC.visibility_of_element_located((By.CLASS_NAME, "judgments"))
+        )
+        return judgments_div.text
+
+    async def fetch(self, url: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._fetch, url)
+
+    def close(self) -> None:
+        if self._driver is not None:
+            self._driver.quit()
+            self._driver = None
+        self._executor.shutdown(wait=False)
+
+
+class DownloadManifest:
+    """Append-only record of the documents that have been downloaded, keyed by document id.
+
+    Each completed document is one JSON line, written after its text file is
+    in place, so a crash loses at most the document that was in flight.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by a crash
+                    self.entries[entry["doc_id"]] = entry
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.entries
+
+    def record(self, doc_id: str, **fields) -> None:
+        entry = dict(fields, doc_id=doc_id)
+        self.entries[doc_id] = entry
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+class JudgmentDownloader:
+    """Download judgment texts concurrently into `output_dir/<doc id>.txt`.
+
+    `workers` pages are fetched at a time, no faster than `rate` requests per
+    second per host. Pages are parsed from plain HTTP first; only when that
+    fails is the page loaded in a headless browser (if `use_browser`).
+    Documents already in the manifest are skipped, so reruns resume.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        base_url: str = BASE_URL,
+        workers: int = 8,
+        rate: float = 2.0,
+        retries: int = 4,
+        backoff: float = 1.0,
+        timeout: float = 30,
+        use_browser: bool = True,
+    ) -> None:
+        self.output_dir = output_dir
+        self.base_url = base_url
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = HostRateLimiter(rate)
+        self.browser = BrowserFallback() if use_browser else None
+        os.makedirs(output_dir, exist_ok=True)
+        self.manifest = DownloadManifest(os.path.join(output_dir, MANIFEST_FNAME))
+        self.failed: Dict[str, str] = {}
+
+    async def _download(self, session: aiohttp.ClientSession, doc_id: str) -> None:
+        url = doc_url(doc_id, self.base_url)
+        method = "http"
+        try:
+            text = extract_judgment(await fetch(session, url, self.limiter, self.retries, self.backoff))
+        except (RuntimeError, aiohttp.ClientError) as e:
+            # Includes 403s: the site turns away clients it does not take for a browser
+            logger.warning("Fetching %s failed: %s", url, e)
+            text = None
+        if text is None and self.browser is not None:
+            method = "browser"
+            await self.limiter.wait(url)
+            text = await self.browser.fetch(url)
+        if not text:
+            raise RuntimeError(f"No judgment text found at {url}")
+
+        path = os.path.join(self.output_dir, f"{doc_id}.txt")
+        write_atomic(path, text)
+        self.manifest.record(doc_id, path=path, method=method, chars=len(text))
+
+    async def _worker(self, session: aiohttp.ClientSession, queue: asyncio.Queue) -> None:
+        while True:
+            doc_id = await queue.get()
+            try:
+                await self._download(session, doc_id)
+            except Exception as e:
+                self.failed[doc_id] = str(e)
+                logger.error("Failed to download %s: %s", doc_id, e)
+            finally:
+                queue.task_done()
+
+    async def run(self, links: Iterable[str]) -> Dict[str, int]:
+        """Download every linked document not yet in the manifest and return counts."""
+        doc_ids = list(dict.fromkeys(filter(None, (doc_id_from_link(link) for link in links))))
+        pending = [doc_id for doc_id in doc_ids if doc_id not in self.manifest]
+        queue: asyncio.Queue = asyncio.Queue()
+        for doc_id in pending:
+            queue.put_nowait(doc_id)
+
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            workers = [asyncio.create_task(self._worker(session, queue)) for _ in range(self.workers)]
+            try:
+                await queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                if self.browser is not None:
+                    self.browser.close()
+
+        return {
+            "documents": len(doc_ids),
+            "skipped": len(doc_ids) - len(pending),
+            "downloaded": len(pending) - len(self.failed),
+            "failed": len(self.failed),
+        }
+
+
+class LinkSet:
+    """Document ids already in a link file, which new links are streamed onto.
+
+    The file keeps the one-URL-per-line format the downloader reads; every
+    new id is appended and flushed as soon as it is added.
+    """
+
+    def __init__(self, path: str, base_url: str = BASE_URL) -> None:
+        self.path = path
+        self.base_url = base_url
+        self.doc_ids = set()
+        if os.path.exists(path):
+            self.doc_ids.update(filter(None, (doc_id_from_link(link) for link in read_links(path))))
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_ids
+
+    def add(self, doc_id: str) -> bool:
+        """Record a document id, returning False if it was already known."""
+        if doc_id in self.doc_ids:
+            return False
+        self.doc_ids.add(doc_id)
+        self._file.write(f"{self.base_url.rstrip('/')}/doc/{doc_id}\n")
+        self._file.flush()
+        return True
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SearchHarvester:
+    """Collect judgment links from paginated search results.
+
+    Pages are fetched `workers` at a time, up to `max_pages` pages from
+    `start_page`. Harvesting stops after the first batch in which a page
+    loads but brings no new document ids, i.e. the results are exhausted or
+    were already harvested by an earlier run. A page that still fails after
+    retries is skipped and counted, and does not stop the harvest.
+    """
+
+    def __init__(
+        self,
+        links: LinkSet,
+        base_url: str = BASE_URL,
+        workers: int = 4,
+        rate: float = 2.0,
+        retries: int = 4,
+        timeout: float = 30,
+    ) -> None:
+        self.links = links
+        self.base_url = base_url
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self.limiter = HostRateLimiter(rate)
+
+    async def _fetch_page(self, session: aiohttp.ClientSession, query: str, page_num: int) -> Optional[List[str]]:
+        """Return the document ids on a results page, or None if it could not be fetched."""
+        url = search_url(query, page_num, self.base_url)
+        try:
+            return extract_result_links(await fetch(session, url, self.limiter, self.retries))
+        except (RuntimeError, aiohttp.ClientError) as e:
+            logger.warning("Skipping results page %d: %s", page_num, e)
+            return None
+
+    async def run(self, query: str, start_page: int = 0, max_pages: int = 10) -> Dict[str, int]:
+        """Harvest up to max_pages result pages and return counts."""
+        pages = found = new = failed = 0
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            page_num, end = start_page, start_page + max_pages
+            while page_num < end:
+                batch = range(page_num, min(page_num + self.workers, end))
+                results = await asyncio.gather(*(self._fetch_page(session, query, n) for n in batch))
+                exhausted = False
+                # Add in page order so the link file keeps the search ranking
+                for doc_ids in results:
+                    if doc_ids is None:
+                        failed += 1
+                        continue
+                    added = sum(self.links.add(doc_id) for doc_id in doc_ids)
+                    found += len(doc_ids)
+                    new += added
+                    exhausted = exhausted or added == 0
+                pages += len(batch)
+                page_num = batch.stop
+                if exhausted:
+                    logger.info("No new results on a page before page %d, stopping", page_num)
+                    break
+        return {"pages": pages, "links_found": found, "new_links": new, "failed_pages": failed}
+
+
+def read_links(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+from collections import Counter
+from typing import Dict, List
+
+from aiohttp import web
+
+from scraping import JudgmentDownloader, doc_url
+
+# Documents the stand-in serves, and how it misbehaves for some of them
+THROTTLED_DOC = "1002"  # 429 for the first THROTTLED_TIMES requests, then the page
+THROTTLED_TIMES = 2
+FORBIDDEN_DOC = "1003"  # always 403, like the site does for clients it takes for bots
+BROKEN_DOC = "1004"  # always 503, so it fails once retries run out
+DOC_IDS = ["1001", THROTTLED_DOC, FORBIDDEN_DOC, BROKEN_DOC, "1005"]
+
+
+def judgment_text(doc_id: str) -> str:
+    return f"Judgment {doc_id}. The appeal under Section 34 of the Arbitration and Conciliation Act, 1996 is dismissed."
+
+
+class StandInSite:
+    """Local stand-in for the judgments site, serving /doc/<id>/ pages."""
+
+    def __init__(self) -> None:
+        self.hits: Counter = Counter()
+        self.app = web.Application()
+        self.app.router.add_get("/doc/{doc_id}/", self.doc)
+
+    async def doc(self, request: web.Request) -> web.Response:
+        doc_id = request.match_info["doc_id"]
+        self.hits[doc_id] += 1
+        if doc_id == THROTTLED_DOC and self.hits[doc_id] <= THROTTLED_TIMES:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        if doc_id == FORBIDDEN_DOC:
+            return web.Response(status=403)
+        if doc_id == BROKEN_DOC:
+            return web.Response(status=503)
+        if doc_id not in DOC_IDS:
+            return web.Response(status=404)
+        html = f'<html><body><div class="judgments"><p>{judgment_text(doc_id)}</p></div></body></html>'
+        return web.Response(text=html, content_type="text/html")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        return f"http://{host}:{bound_port}"
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+class StandInBrowser:
+    """Takes the place of BrowserFallback, recording the pages it was asked for."""
+
+    def __init__(self) -> None:
+        self.urls: List[str] = []
+
+    async def fetch(self, url: str) -> str:
+        self.urls.append(url)
+        doc_id = url.rstrip("/").rsplit("/", 1)[-1]
+        # The broken page has no judgment in a browser either
+        return "" if doc_id == BROKEN_DOC else judgment_text(doc_id)
+
+    def close(self) -> None:
+        pass
+
+
+async def check_downloader() -> Dict[str, Dict[str, int]]:
+    """Download from the stand-in twice and check retries, the browser fallback and resuming."""
+    site = StandInSite()
+    base_url = await site.start()
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            links = [doc_url(doc_id, base_url) for doc_id in DOC_IDS]
+
+            downloader = JudgmentDownloader(output_dir, base_url=base_url, workers=3, rate=0,
+                                            retries=2, backoff=0.01, use_browser=False)
+            browser = downloader.browser = StandInBrowser()
+            first = await downloader.run(links)
+
+            # Throttled twice, then served on the last retry
+            assert site.hits[THROTTLED_DOC] == THROTTLED_TIMES + 1, site.hits
+            assert downloader.manifest.entries[THROTTLED_DOC]["method"] == "http"
+            # A 403 is not retried, and the page is loaded in the browser instead
+            assert site.hits[FORBIDDEN_DOC] == 1, site.hits
+            assert doc_url(FORBIDDEN_DOC, base_url) in browser.urls, browser.urls
+            assert downloader.manifest.entries[FORBIDDEN_DOC]["method"] == "browser"
+            # Retries run out on a page that keeps failing; the browser finds nothing there either
+            assert site.hits[BROKEN_DOC] == 3, site.hits
+            assert sorted(browser.urls) == [doc_url(FORBIDDEN_DOC, base_url), doc_url(BROKEN_DOC, base_url)]
+            assert first == {"documents": 5, "skipped": 0, "downloaded": 4, "failed": 1}, first
+            for doc_id in DOC_IDS:
+                path = os.path.join(output_dir, f"{doc_id}.txt")
+                if doc_id != BROKEN_DOC:
+                    with open(path, "r", encoding="utf-8") as f:
+                        assert f.read() == judgment_text(doc_id), path
+
+            # A rerun resumes from the manifest: only the failed document is fetched again
+            hits = Counter(site.hits)
+            rerun = JudgmentDownloader(output_dir, base_url=base_url, workers=3, rate=0,
+                                       retries=0, backoff=0.01, use_browser=False)
+            second = await rerun.run(links)
+            assert second == {"documents": 5, "skipped": 4, "downloaded": 0, "failed": 1}, second
+            assert site.hits - hits == Counter({BROKEN_DOC: 1}), site.hits - hits
+    finally:
+        await site.stop()
+    return {"first": first, "rerun": second}
+
+
+async def serve(port: int) -> None:
+    site = StandInSite()
+    base_url = await site.start(port=port)
+    print(f"Serving {len(DOC_IDS)} judgments at {base_url}; set JUDGMENTS_BASE_URL to use it")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the judgments site.")
+    parser.add_argument("--serve", action="store_true", help="keep serving instead of running the downloader checks")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.serve:
+        asyncio.run(serve(args.port))
+    else:
+        print(asyncio.run(check_downloader()))
+        print("JudgmentDownloader checks passed")
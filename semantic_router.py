@@ -0,0 +1,125 @@
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.base_selector import BaseSelector, MetadataType, SelectorResult, SingleSelection
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.prompts.mixin import PromptDictType
+from llama_index.core.schema import QueryBundle
+from llama_index.core.tools.types import ToolMetadata
+from concurrency import run_blocking
+from telemetry import annotate, span
+
+
+class SemanticSelector(BaseSelector):
+    """Select a query engine tool locally instead of asking the LLM.
+
+    Keyword rules are checked first. Otherwise the query embedding is compared
+    with the (cached) embeddings of the tool descriptions by cosine similarity.
+    Only when the two best tools score within `margin` of each other is the
+    decision handed to `fallback_selector`, usually an LLMSingleSelector.
+    Tools listed together in `tool_groups` share a query engine, so a close
+    call between them is not worth asking about; the margin is measured
+    against the best tool of another group.
+    """
+
+    def __init__(
+        self,
+        embed_model: Optional[BaseEmbedding] = None,
+        keyword_rules: Optional[Dict[str, List[str]]] = None,
+        margin: float = 0.05,
+        fallback_selector: Optional[BaseSelector] = None,
+        tool_groups: Optional[List[List[str]]] = None,
+    ) -> None:
+        self._embed_model = embed_model or Settings.embed_model
+        self._tool_groups = {name: i for i, names in enumerate(tool_groups or []) for name in names}
+        self._margin = margin
+        self._fallback_selector = fallback_selector
+        self._description_embeddings: Dict[Tuple[str, ...], np.ndarray] = {}
+
+        # One case-insensitive, word-bounded pattern per tool name
+        self._keyword_rules = [
+            (tool_name, re.compile(r"\b(" + "|".join(map(re.escape, keywords)) + r")\b", re.IGNORECASE))
+            for tool_name, keywords in (keyword_rules or {}).items()
+        ]
+
+    def select(self, choices: Sequence[MetadataType], query: Union[str, QueryBundle]) -> SelectorResult:
+        with span("route"):
+            return super().select(choices, query)
+
+    async def aselect(self, choices: Sequence[MetadataType], query: Union[str, QueryBundle]) -> SelectorResult:
+        with span("route"):
+            return await super().aselect(choices, query)
+
+    def _get_prompts(self) -> Dict[str, Any]:
+        return {}
+
+    def _update_prompts(self, prompts: PromptDictType) -> None:
+        pass
+
+    def _match_rule(self, choices: Sequence[ToolMetadata], query: QueryBundle) -> Optional[SelectorResult]:
+        names = [choice.name for choice in choices]
+        for tool_name, pattern in self._keyword_rules:
+            match = pattern.search(query.query_str)
+            if match and tool_name in names:
+                return SelectorResult(selections=[
+                    SingleSelection(index=names.index(tool_name), reason=f"Matched keyword '{match.group(0)}'.")
+                ])
+        return None
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _rank(self, choices: Sequence[ToolMetadata], description_matrix: np.ndarray, query_embedding: List[float]):
+        """Return the best tool index, its score and whether the best tool of another group is within the margin."""
+        scores = description_matrix @ self._normalize(np.asarray(query_embedding, dtype=np.float32))
+        order = np.argsort(-scores)
+        best = int(order[0])
+        groups = [self._tool_groups.get(choice.name, choice.name) for choice in choices]
+        rivals = [i for i in order[1:] if groups[i] != groups[best]]
+        ambiguous = bool(rivals) and scores[best] - scores[rivals[0]] < self._margin
+        return best, float(scores[best]), ambiguous
+
+    def _select(self, choices: Sequence[ToolMetadata], query: QueryBundle) -> SelectorResult:
+        result = self._match_rule(choices, query)
+        if result is not None:
+            annotate("route", "keyword")
+            return result
+
+        descriptions = tuple(choice.description for choice in choices)
+        if descriptions not in self._description_embeddings:
+            embeddings = self._embed_model.get_text_embedding_batch(list(descriptions))
+            self._description_embeddings[descriptions] = self._normalize(np.asarray(embeddings, dtype=np.float32))
+
+        query_embedding = query.embedding or self._embed_model.get_query_embedding(query.query_str)
+        best, score, ambiguous = self._rank(choices, self._description_embeddings[descriptions], query_embedding)
+        if ambiguous and self._fallback_selector is not None:
+            annotate("route", "llm")
+            with span("route.llm"):
+                return self._fallback_selector.select(choices, query)
+        annotate("route", "embedding")
+        return SelectorResult(selections=[SingleSelection(index=best, reason=f"Closest description (cosine {score:.3f}).")])
+
+    async def _aselect(self, choices: Sequence[ToolMetadata], query: QueryBundle) -> SelectorResult:
+        result = self._match_rule(choices, query)
+        if result is not None:
+            annotate("route", "keyword")
+            return result
+
+        descriptions = tuple(choice.description for choice in choices)
+        if descriptions not in self._description_embeddings:
+            embeddings = await run_blocking(self._embed_model.get_text_embedding_batch, list(descriptions))
+            self._description_embeddings[descriptions] = self._normalize(np.asarray(embeddings, dtype=np.float32))
+
+        # Local embedding models are CPU bound, so they run on the worker pool
+        query_embedding = query.embedding or await run_blocking(self._embed_model.get_query_embedding, query.query_str)
+        best, score, ambiguous = self._rank(choices, self._description_embeddings[descriptions], query_embedding)
+        if ambiguous and self._fallback_selector is not None:
+            annotate("route", "llm")
+            with span("route.llm"):
+                return await self._fallback_selector.aselect(choices, query)
+        annotate("route", "embedding")
+        return SelectorResult(selections=[SingleSelection(index=best, reason=f"Closest description (cosine {score:.3f}).")])
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class Session:
+    """The uploads and indices of one client session."""
+
+    def __init__(self, session_id: str, pipeline: Any, upload_dir: str) -> None:
+        self.session_id = session_id
+        self.pipeline = pipeline
+        self.upload_dir = upload_dir
+        # Uploads to the same session are indexed one at a time
+        self.lock = asyncio.Lock()
+        self.memory = 0
+        self.last_used = time.monotonic()
+        # Ingestion jobs queued or running for this session; it is not evicted while any are
+        self.pending_jobs = 0
+
+    @property
+    def busy(self) -> bool:
+        return self.pending_jobs > 0 or self.lock.locked()
+
+
+class SessionManager:
+    """Keep per-session pipelines in memory, evicting idle sessions LRU-first.
+
+    A session is created by its first upload. Whenever the estimated memory
+    of all sessions exceeds `memory_budget` bytes, the least recently used
+    sessions are dropped together with their upload directories. Sessions
+    unused for `idle_ttl` seconds are dropped by `evict_idle`, whatever
+    their size. Sessions with pending ingestion jobs are never evicted.
+    """
+
+    def __init__(self, pipeline_factory: Callable[[], Any], upload_root: str, memory_budget: int,
+                 idle_ttl: float = 3600) -> None:
+        self.pipeline_factory = pipeline_factory
+        self.upload_root = upload_root
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def validate(session_id: str) -> str:
+        # Session ids become directory names, so only allow a safe alphabet
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise HTTPException(status_code=400, detail="Invalid session id.")
+        return session_id
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: Optional[str]) -> Optional[Session]:
+        """Return a live session and mark it as recently used, or None."""
+        if session_id is None:
+            return None
+        session = self._sessions.get(self.validate(session_id))
+        if session is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def get_or_create(self, session_id: str) -> Session:
+        session = self.get(session_id)
+        if session is None:
+            self.evict_idle()
+            upload_dir = os.path.join(self.upload_root, session_id)
+            os.makedirs(upload_dir, exist_ok=True)
+            session = Session(session_id, self.pipeline_factory(), upload_dir)
+            self._sessions[session_id] = session
+        return session
+
+    @property
+    def memory(self) -> int:
+        return sum(session.memory for session in self._sessions.values())
+
+    def update_memory(self, session: Session, memory: int) -> None:
+        """Record a session's new memory estimate and evict other sessions if over budget."""
+        session.memory = memory
+        for session_id in list(self._sessions):
+            if self.memory <= self.memory_budget:
+                break
+            victim = self._sessions[session_id]
+            if victim is session or victim.busy:
+                continue
+            self.evict(session_id)
+
+    def evict_idle(self) -> int:
+        """Evict every session unused for longer than idle_ttl and return how many."""
+        cutoff = time.monotonic() - self.idle_ttl
+        # Sessions are kept in LRU order, so the idle ones come first
+        idle = []
+        for session_id, session in self._sessions.items():
+            if session.last_used > cutoff:
+                break
+            if not session.busy:
+                idle.append(session_id)
+        for session_id in idle:
+            self.evict(session_id)
+        return len(idle)
+
+    def evict(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        shutil.rmtree(session.upload_dir, ignore_errors=True)
+        self.evictions += 1
+        logger.info("Evicted session %s (%d bytes, idle %.0fs)", session_id, session.memory, time.monotonic() - session.last_used)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "memory_bytes": self.memory,
+            "memory_budget_bytes": self.memory_budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "idle_ttl_seconds": self.idle_ttl,
+        }
@@ -7,11 +7,16 @@ import { FaCloudUploadAlt } from "react-icons/fa"; // Import the upload icon
 import ReactMarkdown from "react-markdown"; // Import react-markdown for rendering markdown
 import { TextGenerateEffect } from "@/components/ui/text-generate-effect"; // Import your text generation effect
 
+// Stop waiting for an indexing job after this many one-second polls
+const MAX_JOB_POLLS = 900;
+
 export default function SearchPage() {
 	const [apiResponse, setApiResponse] = useState(""); // State for API response
 	const [query, setQuery] = useState(""); // State for input query
 	const [loading, setLoading] = useState(false); // State for loading
 	const [file, setFile] = useState<File | null>(null); // State for file
+	const [sessionId, setSessionId] = useState<string | null>(null); // Session that owns the uploaded files
+	const [uploadError, setUploadError] = useState<string | null>(null); // Why the last upload failed, if it did
 
 	const placeholders = [
 		"Breach of contract due to force majeure in the textile industry",
@@ -29,6 +34,7 @@ export default function SearchPage() {
 		const selectedFiles = e.target.files; // Get the selected files
 		if (selectedFiles && selectedFiles.length > 0) {
 			setLoading(true); // Show loading indicator
+			setUploadError(null);
 
 			const formData = new FormData();
 			for (let i = 0; i < selectedFiles.length; i++) {
@@ -40,6 +46,7 @@ export default function SearchPage() {
 					"http://localhost:80/upload-files",
 					{
 						method: "POST",
+						headers: sessionId ? { "X-Session-ID": sessionId } : {},
 						body: formData, // Send the files to the backend
 					}
 				);
@@ -49,9 +56,30 @@ export default function SearchPage() {
 				}
 
 				const data = await response.json();
+				setSessionId(data.session_id); // Later uploads and queries go to this session
 				console.log("Files uploaded successfully:", data);
+
+				// Indexing runs in the background; wait for the job before querying the new files
+				let job = { status: "queued" };
+				for (let polls = 0; job.status !== "done" && job.status !== "failed"; polls++) {
+					if (polls >= MAX_JOB_POLLS) {
+						throw new Error("Timed out waiting for the files to be indexed");
+					}
+					await new Promise((resolve) => setTimeout(resolve, 1000));
+					const jobResponse = await fetch(`http://localhost:80/jobs/${data.job_id}`);
+					// A 404 means the job was pruned or the server restarted; it will never finish
+					if (!jobResponse.ok) {
+						throw new Error(`Lost track of the indexing job (${jobResponse.status})`);
+					}
+					job = await jobResponse.json();
+					console.log("Indexing progress:", job);
+				}
+				if (job.status === "failed") {
+					throw new Error("Failed to index files");
+				}
 			} catch (error) {
 				console.error("Error uploading files:", error);
+				setUploadError(error instanceof Error ? error.message : "Failed to upload files");
 			} finally {
 				setLoading(false); // Hide loading indicator
 			}
@@ -71,6 +99,7 @@ export default function SearchPage() {
 				method: "POST",
 				headers: {
 					"Content-Type": "application/json",
+					...(sessionId ? { "X-Session-ID": sessionId } : {}),
 				},
 				body: JSON.stringify({ question: query }), // Send the query state in the request
 			});
@@ -114,6 +143,10 @@ export default function SearchPage() {
 					/>
 				</label>
 
+				{uploadError && (
+					<span className="ml-4 text-lg text-red-500">{uploadError}</span>
+				)}
+
 				{/* Display selected file name */}
 				{file && (
 					<span className="ml-4 text-lg text-gray-700">
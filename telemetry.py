@@ -0,0 +1,96 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from prometheus_client import Histogram
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Time spent in each stage of answering a query.", ["stage"], buckets=LATENCY_BUCKETS
+)
+CANDIDATES = Histogram(
+    "rag_candidates", "Number of nodes coming out of each retrieval stage.", ["stage"],
+    buckets=(0, 1, 2, 5, 10, 20, 32, 50, 64, 100, 200),
+)
+PROMPT_TOKENS = Histogram(
+    "rag_prompt_tokens", "Size of the prompts sent to the LLM, in tokens.", ["engine"],
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536),
+)
+
+
+class Trace:
+    """Spans and values recorded while answering one request.
+
+    Filled in from the request's own task and from the worker threads it hands
+    work to, which see the same trace through the copied context.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.values: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, seconds: float) -> None:
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self.start) * 1000, 3),
+                "ms": round(seconds * 1000, 3),
+            })
+
+    def set(self, name: str, value: Any) -> None:
+        with self._lock:
+            self.values[name] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.start) * 1000, 3),
+                "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+                "values": dict(self.values),
+            }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace() -> Trace:
+    """Collect the spans of the current request, and of the work it starts, into a new trace."""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a stage into the stage histogram and the current trace, if any."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(stage, start, seconds)
+
+
+def annotate(name: str, value: Any) -> None:
+    """Attach a value to the current trace only, e.g. how a query was routed."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.set(name, value)
+
+
+def record_candidates(stage: str, count: int) -> None:
+    CANDIDATES.labels(stage).observe(count)
+    annotate(f"candidates.{stage}", count)
+
+
+def record_prompt_tokens(engine: str, tokens: int) -> None:
+    PROMPT_TOKENS.labels(engine).observe(tokens)
+    annotate(f"prompt_tokens.{engine}", tokens)